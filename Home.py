@@ -1,14 +1,34 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import os
-import json
-from anthropic import Anthropic
+from collections import OrderedDict
+from exam_index import INDEX_STORE
+from question_bank import QUESTION_BANK
+from worksheet_format import Question
+from anthropic import APIError
+from claude_client import BREAKER, CircuitOpenError
+from metrics import METRICS
+from request_scheduler import SCHEDULER, set_request_context
+from generators import (
+    TOPICS,
+    SUBTOPICS,
+    get_subtopics,
+    resolve_subtopics,
+    generate_similar_question,
+    stream_worksheet,
+    stream_answer,
+    solve_worksheet,
+    WORKSHEET_POOL,
+    ANSWER_PREFETCHER,
+    IN_FLIGHT,
+    prompt_cache_stats,
+)
 
 #PAGE CONFIG (MUST BE FIRST ST COMMAND)
 st.set_page_config(page_title="Leaving Certificate Honours Maths", layout="centered")
 
 #st.write("API Key exists:", "ANTHROPIC_API_KEY" in os.environ)
 #st.write("API Key value:", os.environ.get("ANTHROPIC_API_KEY", "NOT FOUND")[:20] + "...")
-client = Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
 
 
 # -----------------------------
@@ -25,424 +45,139 @@ client = Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
 #        return None
 
 
-def load_all_exam_indexes():
-    files = [
-        'JSON Files/exam-index1.json',
-        'JSON Files/exam-index2.json',
-        'JSON Files/exam-index3.json',
-        'JSON Files/exam-index4.json',
-        'JSON Files/exam-index5.json',
-    ]
-    all_questions = []
-    all_topics = set()
-
-    for filename in files:
-        try:
-            with open(filename, 'r') as f:
-                data = json.load(f)
-                all_questions.extend(data['questions'])
-                all_topics.update(data['topics'])
-        except FileNotFoundError:
-            st.warning(f"⚠️ {filename} not found.")
-
-    return {
-        "total_questions": len(all_questions),
-        "topics": sorted(list(all_topics)),
-        "questions": all_questions
-    }
-
-
-EXAM_INDEX = load_all_exam_indexes()
-
-# -----------------------------
-# TOPICS + SUBTOPICS
-# -----------------------------
-TOPICS = ["Probability", "Trigonometry", "Algebra", "Geometry of the Circle", "Geometry of the Line", "Statistics", "Enlargements", "Calculus", "Complex Numbers"]
-
-SUBTOPICS = {
-    "Probability": [
-        "Combined events",
-        "Conditional probability",
-        "Expected value",
-        "Permutations and combinations",
-        "Binomial distribution",
-        "Bernoulli Trials",
-        "Normal Distribution"
-    ],
-    "Trigonometry": [
-        "Trigonometric identities",
-        "Graphs",
-        "Radians",
-        "Sine rule / Cosine rule",
-        "Unit Circle",
-        "Pytharagos Theorem",
-        "Angles of Elevation and Depression",
-        "Reference Angles",
-        "Trigonometric Equations",
-        "Trigonometric Functions"
-    ],
-    "Algebra": [
-        "Quadratics",
-        "Functions",
-        "Logs",
-        "Sequences & series",
-        "Inequalities",
-        "Sum and Difference of 2 Cubes",
-        "Algebraic Fractions",
-        "Simultaneous Equations in 2 Variables",
-        "Simultaneous Equations in 3 Variables",
-        "Simultaneous Equations with linear and non-linear Equations",
-        "Manipulation of Formulae",
-        "Surds"
-    ],
-    "Geometry of the Circle": [
-        "Center (0,0) and radius r",
-        "Center (h,k) and radius r",
-        "Equations of the form x^2 +y^2 + 2gx + 2gy + c = 0",
-        "Points outside, inside or on the Circle",
-        "Intersection of a Line and Circle",
-        "Equation of Tangent to a point on the Circle",
-        "Equtaion of Tangents from point outside the Circle",
-        "Touching Circles",
-        "Problems in g,f and c"
-    ],    
-    "Geometry of the Line": [
-        "Area of a Triangle",
-        "Perpendicular Distance from a point to a Line",
-        "Angle between 2 Lines"
-    ],    
-    "Calculus": [
-        "Differentiation",
-        "Integration",
-        "Rates of change",
-        "Area under curves",
-        "Product/Quotient/Chain rule"
-    ],
-    "Statistics": [
-        "Scatter Graphs",
-        "Correlation Coefficient",
-        "Mean, Mode, Median",
-        "Range , Quartiles and Interquatile Range",
-        "Standard Deviation",
-        "z-scores",
-        "Emperical Rule",
-        "Central Limit Theroem",
-        "Confidence Interval",
-        "Hypothesis Testing"
-    ],
-    "Enlargements": [
-        "Translation",
-        "Central Symmetry",
-        "Rotations",
-        "Enlargement"
-    ],
-    "Complex Numbers": [
-        "Addition and Subtraction of Complex Numbers",
-        "Multiplication of Complex Numbers",
-        "Division of Complex Numbers",
-        "Polar Form of Complex Numbers",
-        "De Moivres Theorem"
-    ],
-}
-
-# -----------------------------
-# EXAM INDEX HELPERS
-# -----------------------------
-def find_template_questions(topic, difficulty=None):
-    """Find relevant template questions from the exam index"""
-    if not EXAM_INDEX:
-        return []
-    
-    matching = []
-    for q in EXAM_INDEX.get('questions', []):
-        # Check if any topic matches
-        topic_match = any(topic.lower() in t.lower() for t in q.get('topics', []))
-        
-        if topic_match:
-            if difficulty:
-                if q.get('difficulty', '').lower() == difficulty.lower():
-                    matching.append(q)
-            else:
-                matching.append(q)
-    
-    return matching[:5]  # Return up to 5 templates
+# Parsed once per process and shared by every session (see exam_index.py)
+EXAM_INDEX = INDEX_STORE.get()
+QUESTION_INDEX = INDEX_STORE.get_question_index()
 
-def format_template_for_prompt(templates):
-    """Format template questions for inclusion in AI prompt"""
-    if not templates:
-        return ""
-    
-    formatted = "\n\nREAL LEAVING CERT EXAM EXAMPLES (for style reference only):\n"
-    for i, t in enumerate(templates, 1):
-        formatted += f"\nExample {i}:\n"
-        formatted += f"Question: {t.get('questionNumber', 'N/A')}\n"
-        formatted += f"Topics: {', '.join(t.get('topics', []))}\n"
-        formatted += f"Difficulty: {t.get('difficulty', 'N/A')}\n"
-        formatted += f"Description: {t.get('description', 'N/A')}\n"
-        formatted += f"Year/Paper: {t.get('paper', {}).get('year', 'N/A')} {t.get('paper', {}).get('paper', '')}\n"
-    
-    formatted += "\n⚠️ DO NOT copy these questions. Use them ONLY as style references to create NEW, ORIGINAL questions.\n"
-    return formatted
+for missing_file in INDEX_STORE.missing:
+    st.warning(f"⚠️ {missing_file} not found.")
 
 # -----------------------------
-# Claude CALL
+# SESSION RESULTS
 # -----------------------------
-def call_claude(system_prompt, user_prompt):
-    response = client.messages.create(
-        model="claude-sonnet-4-20250514",  # Claude Sonnet 4
-        max_tokens=4096,
-        system=system_prompt,  # System prompt is separate in Claude
-        messages=[
-            {"role": "user", "content": user_prompt}
-        ]
-    )
-    return response.content[0].text
-
+# Generated answers / similar questions, keyed by (action, question), so a
+# rerun re-renders them for free. Oldest entries are evicted past the limit.
+SESSION_RESULTS_MAX = 60
+
+# Identifies this browser session to the answer prefetcher, which stops work
+# for sessions the runtime no longer knows about
+SESSION_ID = get_script_run_ctx().session_id
+# This session's Claude calls queue fairly against other sessions'
+set_request_context(SESSION_ID)
+
+def session_is_active(session_id=SESSION_ID):
+    try:
+        return st.runtime.get_instance().is_active_session(session_id)
+    except RuntimeError:  # the server is shutting down
+        return False
+
+# Shown instead of hanging when the circuit breaker is failing fast
+BUSY_MESSAGE = "⏳ Lots of students are generating right now — please try again in a few seconds."
+# Shown when Claude rejects or fails a request outright
+ERROR_MESSAGE = "⚠️ Something went wrong generating that — please try again."
+
+def remember_result(key, value):
+    results = st.session_state.results
+    results[key] = value
+    results.move_to_end(key)
+    while len(results) > SESSION_RESULTS_MAX:
+        results.popitem(last=False)
+
+def recall_result(key):
+    results = st.session_state.results
+    if key not in results:
+        return None
+    results.move_to_end(key)
+    return results[key]
+
+def forget_worksheet_results():
+    """Drop results tied to worksheet question numbers (kept for past papers)"""
+    results = st.session_state.results
+    for key in [k for k in results if k[0] in ("answer", "similar")]:
+        del results[key]
 
 # -----------------------------
-# LUCKY DIP HELPERS
-# -----------------------------
-def get_subtopics(topic):
-    """Return subtopics with Lucky Dip always at the top."""
-    return ["🎲 Lucky Dip"] + SUBTOPICS.get(topic, [])
-
-def resolve_subtopics(topic, subtopics):
-    """If Lucky Dip selected, return all real subtopics for this topic only."""
-    if "🎲 Lucky Dip" in subtopics:
-        return SUBTOPICS.get(topic, [])
-    return subtopics
-
-# -----------------------------
-# ENHANCED WORKSHEET GENERATORS
+# PAST PAPER BROWSER
 # -----------------------------
-def generate_worksheet(topic, subtopics, difficulty):
-    subtopics = resolve_subtopics(topic, subtopics)
-    chosen = ", ".join(subtopics)
-    
-    # Get template questions from exam index
-    templates = find_template_questions(topic, difficulty)
-    template_context = format_template_for_prompt(templates)
-
-    system_prompt = (
-        "You are a Leaving Cert Higher Level Maths tutor. "
-        "Generate exactly 10 unique exam‑style questions that match REAL Leaving Cert exam style. "
-        f"Difficulty level: {difficulty}. "
-        f"Focus ONLY on these subtopics: {chosen}. "
-        "Use LaTeX formatting for ALL mathematical expressions. "
-        "Use ONLY inline LaTeX with single dollar signs: $ ... $. "
-        "Never use $$ ... $$ under any circumstances. "
-        "Never output plain text maths such as x^2, 1/6, sqrt(x), etc. "
-        "Every mathematical expression must be inside $ ... $. "
-        "Return the questions as a numbered list, one per line, no solutions. "
-        "\n"
-        "IMPORTANT: The examples below are from REAL LC papers. "
-        "Study their style, structure, and difficulty level, then create NEW questions inspired by this format."
-        f"{template_context}"
-    )
-
-    user_prompt = (
-        f"Create a {difficulty} worksheet on {topic}. "
-        f"Subtopics: {chosen}. "
-        "Generate 10 NEW questions that match the LC exam style shown in the examples. "
-        "Ensure ALL maths is in LaTeX wrapped in $ ... $."
-    )
-
-    text = call_claude(system_prompt, user_prompt)
-    return [q.strip() for q in text.split("\n") if q.strip()]
-
-
-def generate_balanced_worksheet(topic, subtopics):
-    subtopics = resolve_subtopics(topic, subtopics)
-    chosen = ", ".join(subtopics)
-    
-    # Get mixed difficulty templates
-    templates = find_template_questions(topic)
-    template_context = format_template_for_prompt(templates)
-
-    system_prompt = (
-        "You are a Leaving Cert Higher Level Maths tutor. "
-        "Generate ONE exam‑style question for EACH selected subtopic. "
-        "Match the authentic LC exam style shown in the reference examples. "
-        "Use LaTeX formatting wrapped in $ ... $. "
-        "Use ONLY inline LaTeX with single dollar signs: $ ... $. "
-        "Never use $$ ... $$ under any circumstances. "
-        "Never output plain text maths such as x^2, 1/6, sqrt(x), etc. "
-        "Every mathematical expression must be inside $ ... $. "
-        "Return a numbered list, no solutions."
-        f"{template_context}"
-    )
-
-    user_prompt = f"Topic: {topic}\nSubtopics: {chosen}\n\nCreate NEW questions matching LC exam style."
-
-    text = call_claude(system_prompt, user_prompt)
-    return [q.strip() for q in text.split("\n") if q.strip()]
-
-
-def generate_answer(question, topic, difficulty):
-    system_prompt = (
-        "You are a Leaving Cert Higher Level Maths tutor. "
-        "Provide a full step‑by‑step worked solution matching LC marking scheme style. "
-        "Use LaTeX formatting wrapped in $ ... $. "
-        "Use ONLY inline LaTeX with single dollar signs: $ ... $. "
-        "Never use $$ ... $$ under any circumstances. "
-        "Never output plain text maths such as x^2, 1/6, sqrt(x), etc. "
-        "Every mathematical expression must be inside $ ... $. "
-        f"Match the difficulty: {difficulty}."
-    )
-
-    user_prompt = f"Topic: {topic}\nQuestion: {question}"
-
-    return call_claude(system_prompt, user_prompt)
-
-
-def generate_similar_question(question, topic, difficulty):
-    # Get templates for better context
-    templates = find_template_questions(topic, difficulty)
-    template_context = format_template_for_prompt(templates[:2])  # Just 2 examples
-    
-    system_prompt = (
-        "You are a Leaving Cert Higher Level Maths tutor. "
-        "Generate ONE new question similar in style and difficulty but not identical. "
-        "Follow authentic LC exam question format. "
-        "Use LaTeX formatting wrapped in $ ... $. "
-        "Use ONLY inline LaTeX with single dollar signs: $ ... $. "
-        "Never use $$ ... $$ under any circumstances. "
-        "Never output plain text maths such as x^2, 1/6, sqrt(x), etc. "
-        "Every mathematical expression must be inside $ ... $. "
-        "No solution."
-        f"{template_context}"
-    )
-
-    user_prompt = f"Topic: {topic}\nOriginal question: {question}\n\nCreate a NEW similar question."
-
-    return call_claude(system_prompt, user_prompt)
-
-
-def generate_exam_style_worksheet(topic, subtopics):
-    subtopics = resolve_subtopics(topic, subtopics)
-    chosen = ", ".join(subtopics)
-    
-    # Get exam templates
-    templates = find_template_questions(topic)
-    template_context = format_template_for_prompt(templates)
-
-    system_prompt = (
-        "You are a Leaving Cert Higher Level Maths examiner. "
-        "Generate questions that EXACTLY match the style, structure, tone, and difficulty "
-        "of REAL LC Higher Level exam papers (see examples below). "
-        "Base your style on typical LC question formats, multi‑part structure, "
-        "mark‑style progression, and the level of mathematical rigor expected. "
-        "You may include multi‑part questions (a), (b), (c). "
-        "You may include diagrams described in words. "
-        "Do NOT quote or reproduce any past exam paper. "
-        "Only create new, original questions inspired by the LC style shown in examples. "
-        "Use LaTeX formatting for ALL mathematical expressions, wrapped in $ ... $. "
-        "Use ONLY inline LaTeX with single dollar signs: $ ... $. "
-        "Never use $$ ... $$ under any circumstances. "
-        "Never output plain text maths such as x^2, 1/6, sqrt(x), etc. "
-        "Every mathematical expression must be inside $ ... $. "
-        "Return exactly 3 exam‑style questions, each possibly multi‑part, no solutions."
-        f"{template_context}"
-    )
-
-    user_prompt = (
-        f"Topic: {topic}\n"
-        f"Subtopics: {chosen}\n"
-        "Generate 3 NEW exam‑style questions matching the LC format shown in examples."
-    )
-
-    text = call_claude(system_prompt, user_prompt)
-    return [q.strip() for q in text.split("\n") if q.strip()]
-
+ALL = "All"
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
 
-def generate_examPaper(topic, subtopics):
-    subtopics = resolve_subtopics(topic, subtopics)
-    chosen = ", ".join(subtopics)
-    
-    # Get exam templates for authentic style
-    templates = find_template_questions(topic)
-    template_context = format_template_for_prompt(templates)
-
-    system_prompt = (
-        "You are a Leaving Certificate Higher Level Maths examiner. "
-        "Generate NEW, original exam‑style questions that EXACTLY match the tone, structure, "
-        "difficulty and progression of REAL LC Higher Level Maths papers (see examples below). "
-        "Follow these rules strictly: "
-        "- Match the authentic LC exam style shown in the reference examples "
-        "- Use multi‑part structure (a), (b), (c) where appropriate "
-        "- Include realistic LC‑style contexts and mathematical reasoning "
-        "- Include marks for each part, e.g. '(a) [10 marks]' "
-        "- ALL mathematical expressions must use LaTeX with $ ... $ delimiters "
-        "- Never output plain‑text maths such as x^2, 1/6, sqrt(x) "
-        "- Always use LaTeX forms such as $x^2$, $\\frac{1}{6}$, $\\sqrt{x}$ "
-        "- Never copy, quote, or paraphrase any past exam paper "
-        "- Create only NEW, original questions inspired by LC exam format "
-        "- Return EXACTLY 3 exam‑style questions "
-        "- Do NOT include solutions "
-        f"{template_context}"
-    )
-
-    user_prompt = (
-        f"Topic: {topic}\n"
-        f"Subtopics: {chosen}\n"
-        "Generate exactly 3 Higher Level exam‑style questions matching REAL LC exam format. "
-        "Each question may contain multiple parts. "
-        "Use LaTeX with $ ... $ for all maths. "
-        "Return the questions separated by blank lines."
-    )
-
-    text = call_claude(system_prompt, user_prompt)
-
-    questions = [q.strip() for q in text.split("\n\n") if q.strip()]
-    return questions[:3]
+# Questions rendered per page; only the current page of the chosen difficulty
+# is drawn, so a rerun costs the same however many questions match
+PAST_PAPER_PAGE_SIZE = 10
 
-
-# -----------------------------
-# PAST PAPER BROWSER
-# -----------------------------
-def show_past_paper_questions(topic):
+def show_past_paper_questions(topic, query="", difficulty=None, year=None, paper=None):
     """Display real past paper questions from the exam index"""
     if not EXAM_INDEX:
         st.warning("📚 Exam index not loaded. Upload exam-index.json to see past paper questions.")
         return
     
-    # Get all questions for this topic
-    matching = []
-    for q in EXAM_INDEX.get('questions', []):
-        if any(topic.lower() in t.lower() for t in q.get('topics', [])):
-            matching.append(q)
+    # Ranked by the search words when there are any, otherwise in paper order
+    matching = QUESTION_INDEX.search(query, topic, difficulty, year, paper)
     
     if not matching:
-        st.info(f"No past paper questions found for {topic}. Try generating new questions!")
+        if query:
+            st.info(f"No past paper questions match \"{query}\". Try fewer words or other filters.")
+        else:
+            st.info(f"No past paper questions found for {topic or 'these filters'}. Try generating new questions!")
         return
     
-    st.markdown(f"### 📖 Real LC Past Paper Questions - {topic}")
+    st.markdown(f"### 📖 Real LC Past Paper Questions - {topic or 'All Topics'}")
     st.caption(f"Found {len(matching)} questions from past papers")
     
-    # Group by difficulty
-    easy = [q for q in matching if q.get('difficulty') == 'Easy']
-    medium = [q for q in matching if q.get('difficulty') == 'Medium']
-    hard = [q for q in matching if q.get('difficulty') == 'Hard']
-    
-    # Show in tabs
-    tab1, tab2, tab3 = st.tabs([f"Easy ({len(easy)})", f"Medium ({len(medium)})", f"Hard ({len(hard)})"])
-    
-    with tab1:
-        display_past_paper_list(easy)
+    if difficulty:
+        display_past_paper_list(matching, (topic, query, difficulty, year, paper))
+        return
     
-    with tab2:
-        display_past_paper_list(medium)
+    # Group by difficulty (ids only; nothing is decoded until it is on screen)
+    grouped = QUESTION_INDEX.split_by_difficulty(matching, DIFFICULTIES)
     
-    with tab3:
-        display_past_paper_list(hard)
+    # Unlike st.tabs, a radio only renders the level being looked at. Counts
+    # stay out of its labels: new labels would make it a new widget and reset it.
+    level = st.radio(
+        "Difficulty level",
+        DIFFICULTIES,
+        horizontal=True,
+        label_visibility="collapsed",
+        key="browse_level",
+    )
+    st.caption(" · ".join(f"{name}: {len(grouped[name])}" for name in DIFFICULTIES))
+    display_past_paper_list(grouped[level], (topic, query, level, year, paper))
 
-def display_past_paper_list(questions):
-    """Display a list of past paper questions"""
-    if not questions:
+def turn_browse_page(step, pages):
+    """Move the past-paper browser `step` pages, staying within 0..pages-1"""
+    page = st.session_state.get("browse_page", 0) + step
+    st.session_state.browse_page = max(0, min(page, pages - 1))
+
+def display_past_paper_list(ids, filters):
+    """Display one page of past paper questions"""
+    if not ids:
         st.info("No questions at this difficulty level")
         return
     
-    for q in questions:
+    # Back to the first page whenever the filters change
+    if st.session_state.get("browse_filters") != filters:
+        st.session_state.browse_filters = filters
+        st.session_state.browse_page = 0
+    
+    pages = (len(ids) + PAST_PAPER_PAGE_SIZE - 1) // PAST_PAPER_PAGE_SIZE
+    page = max(0, min(st.session_state.get("browse_page", 0), pages - 1))
+    st.session_state.browse_page = page
+    
+    if pages > 1:
+        # Callbacks run before the rerun, so the page and the buttons below agree
+        col_prev, col_page, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            st.button("← Previous", key="browse_prev", disabled=page == 0,
+                      on_click=turn_browse_page, args=(-1, pages))
+        with col_next:
+            st.button("Next →", key="browse_next", disabled=page == pages - 1,
+                      on_click=turn_browse_page, args=(1, pages))
+        with col_page:
+            st.caption(f"Page {page + 1} of {pages}")
+    
+    for qid in ids[page * PAST_PAPER_PAGE_SIZE:(page + 1) * PAST_PAPER_PAGE_SIZE]:
+        q = QUESTION_INDEX.questions[qid]
         # Build a unique key from the question's own data — guaranteed no clashes
         q_number = q.get('questionNumber', 'N/A')
         q_year = q.get('paper', {}).get('year', 'N/A')
@@ -450,21 +185,22 @@ def display_past_paper_list(questions):
         unique_key = f"past_{q_year}_{q_paper}_{q_number}"
 
         with st.expander(f"Q{q_number} - {q.get('description', 'No description')[:60]}..."):
-            st.markdown(f"**Question:** {q_number}")
-            st.markdown(f"**Paper:** {q_year} {q.get('paper', {}).get('paper', '')}")
-            st.markdown(f"**Topics:** {', '.join(q.get('topics', []))}")
-            st.markdown(f"**Difficulty:** {q.get('difficulty', 'N/A')}")
-            st.markdown(f"**Concepts:** {', '.join(q.get('concepts', []))}")
-            st.markdown(f"\n**Description:**")
-            st.info(q.get('description', 'No description available'))
+            st.markdown(QUESTION_INDEX.details_markdown(qid))
             
             # Generate similar button — unique key derived from question data
             if st.button(f"Generate Similar Question", key=unique_key):
-                similar = generate_similar_question(
-                    q.get('description', ''),
-                    ', '.join(q.get('topics', [])),
-                    q.get('difficulty', 'Medium')
-                )
+                try:
+                    remember_result(("past_similar", unique_key), generate_similar_question(
+                        q.get('description', ''),
+                        ', '.join(q.get('topics', [])),
+                        q.get('difficulty', 'Medium')
+                    ))
+                except CircuitOpenError:
+                    st.warning(BUSY_MESSAGE)
+                except APIError:
+                    st.error(ERROR_MESSAGE)
+            similar = recall_result(("past_similar", unique_key))
+            if similar is not None:
                 st.markdown("**✨ New Question (Similar Style):**")
                 st.markdown(similar)
 
@@ -514,6 +250,11 @@ st.markdown(
 # Show index status
 if EXAM_INDEX:
     st.success(f"✅ Questions Loaded: {EXAM_INDEX.get('total_questions', 0)}")
+    index_stats = INDEX_STORE.stats()
+    st.caption(
+        f"Index: {index_stats['files']} files ({index_stats['format']}), {index_stats['size_bytes'] / 1024:.0f} KB, "
+        f"loaded in {index_stats['load_ms']:.0f} ms"
+    )
 else:
     st.warning("⚠️ Exam index not loaded - questions will be generated without LC past paper templates")
 
@@ -547,8 +288,8 @@ with main_tab1:
         st.session_state.questions = []
     if "difficulty" not in st.session_state:
         st.session_state.difficulty = []
-    if "similar_questions" not in st.session_state:
-        st.session_state.similar_questions = {}
+    if "results" not in st.session_state:
+        st.session_state.results = OrderedDict()
 
     # -----------------------------
     # WORKSHEET BUTTONS (MOBILE‑FIRST)
@@ -556,22 +297,20 @@ with main_tab1:
     st.markdown("### Generate Exam Questions")
 
     # Row 1 — Difficulty
+    requested_difficulty = None
     c1, c2, c3 = st.columns(3)
 
     with c1:
         if st.button("Easy", use_container_width=True):
-            st.session_state.difficulty = "Easy"
-            st.session_state.questions = generate_worksheet(topic, subtopics, "Easy")
+            requested_difficulty = "Easy"
 
     with c2:
         if st.button("Medium", use_container_width=True):
-            st.session_state.difficulty = "Medium"
-            st.session_state.questions = generate_worksheet(topic, subtopics, "Medium")
+            requested_difficulty = "Medium"
 
     with c3:
         if st.button("Hard", use_container_width=True):
-            st.session_state.difficulty = "Hard"
-            st.session_state.questions = generate_worksheet(topic, subtopics, "Hard")
+            requested_difficulty = "Hard"
 
     # Row 2 — Random / Balanced / Exam Style
   #  c4, c5, c6 = st.columns(3)
@@ -595,6 +334,44 @@ with main_tab1:
 
     st.markdown("---")
 
+    # Stream the new worksheet in, showing each question as its line completes
+    if requested_difficulty:
+        st.session_state.difficulty = requested_difficulty
+        st.session_state.questions = []
+        forget_worksheet_results()
+        ANSWER_PREFETCHER.cancel(SESSION_ID)
+
+        # Served instantly from the offline question bank (batch_generate.py) if it
+        # covers this choice, else from the background pool if one is ready
+        chosen = resolve_subtopics(topic, subtopics)
+        banked = QUESTION_BANK.draw(
+            topic, chosen, requested_difficulty,
+            all_subtopics=set(chosen) == set(SUBTOPICS.get(topic, [])),
+        )
+        banked = [Question.from_stored(text) for text in banked]
+        pooled = banked or WORKSHEET_POOL.take(topic, subtopics, requested_difficulty)
+        if pooled:
+            st.session_state.questions = pooled
+        else:
+            live = st.empty()
+            try:
+                with live.container():
+                    for n, question in enumerate(stream_worksheet(topic, subtopics, requested_difficulty), 1):
+                        st.session_state.questions.append(question)
+                        st.markdown(f"**Question {n}**")
+                        st.markdown(question.markdown())
+                live.empty()
+            except CircuitOpenError:
+                live.warning(BUSY_MESSAGE)
+            except APIError:
+                live.error(ERROR_MESSAGE)
+
+        if st.session_state.questions:
+            ANSWER_PREFETCHER.schedule(
+                SESSION_ID, [q.markdown() for q in st.session_state.questions],
+                topic, requested_difficulty, session_is_active,
+            )
+
     # -----------------------------
     # DISPLAY WORKSHEET
     # -----------------------------
@@ -615,6 +392,9 @@ with main_tab1:
         if subtopics:
             st.caption("Subtopics: " + ", ".join(subtopics))
 
+        solve_all = st.button("Solve whole worksheet", use_container_width=True)
+        answer_slots = {}
+
         for i, q in enumerate(questions):
             st.markdown(
                 f"""
@@ -631,20 +411,67 @@ with main_tab1:
                 unsafe_allow_html=True
             )
 
-            st.markdown(q)
+            st.markdown(q.markdown())
+            details = [q.subtopic, f"{q.marks} marks" if q.marks else None]
+            if any(details):
+                st.caption(" · ".join(d for d in details if d))
 
             b1, b2 = st.columns(2)
 
             with b1:
-                if st.button(f"Show Answer", key=f"ans_{i}", use_container_width=True):
-                    ans = generate_answer(q, topic, difficulty)
-                    st.markdown(ans)
+                show_answer = st.button(f"Show Answer", key=f"ans_{i}", use_container_width=True)
 
             with b2:
-                if st.button(f"More Like This", key=f"more_{i}", use_container_width=True):
-                    sim = generate_similar_question(q, topic, difficulty)
-                    st.markdown("**Another question like this:**")
-                    st.markdown(sim)
+                more_like_this = st.button(f"More Like This", key=f"more_{i}", use_container_width=True)
+
+            # Already-generated results come from session state, not the API
+            answer_slots[i] = st.empty()
+            answer = recall_result(("answer", i))
+            if answer is None and show_answer:
+                answer = ANSWER_PREFETCHER.take(SESSION_ID, i, q.markdown())
+                if answer is not None:
+                    remember_result(("answer", i), answer)
+            if answer is not None:
+                answer_slots[i].markdown(answer)
+            elif show_answer:
+                try:
+                    with answer_slots[i].container():
+                        remember_result(("answer", i), st.write_stream(stream_answer(q.markdown(), topic, difficulty)))
+                except CircuitOpenError:
+                    answer_slots[i].warning(BUSY_MESSAGE)
+                except APIError:
+                    answer_slots[i].error(ERROR_MESSAGE)
+
+            if more_like_this:
+                try:
+                    remember_result(("similar", i), generate_similar_question(q.markdown(), topic, difficulty))
+                except CircuitOpenError:
+                    st.warning(BUSY_MESSAGE)
+                except APIError:
+                    st.error(ERROR_MESSAGE)
+            sim = recall_result(("similar", i))
+            if sim is not None:
+                st.markdown("**Another question like this:**")
+                st.markdown(sim)
+
+        # Fill in every missing answer, each one rendering as soon as it lands
+        if solve_all:
+            unsolved = []
+            for i, q in enumerate(questions):
+                if recall_result(("answer", i)) is not None:
+                    continue
+                answer = ANSWER_PREFETCHER.take(SESSION_ID, i, q.markdown())
+                if answer is None:
+                    unsolved.append((i, q.markdown()))
+                else:
+                    remember_result(("answer", i), answer)
+                    answer_slots[i].markdown(answer)
+            for i, answer in solve_worksheet(unsolved, topic, difficulty):
+                if answer is None:
+                    answer_slots[i].error("⚠️ Couldn't generate this answer — try Show Answer.")
+                    continue
+                remember_result(("answer", i), answer)
+                answer_slots[i].markdown(answer)
 
     else:
         st.info("Choose a topic, pick subtopics, and select mode to begin.")
@@ -656,13 +483,63 @@ with main_tab2:
     st.markdown("### Browse Real LC Past Paper Questions")
     
     if EXAM_INDEX:
-        browse_topic = st.selectbox(
-            "Select topic to browse:",
-            TOPICS,
-            key="browse_topic"
+        facets = QUESTION_INDEX.facets()
+        browse_query = st.text_input(
+            "Search past papers:",
+            key="browse_query",
+            placeholder="e.g. tangent, De Moivre, binomial"
         )
         
-        show_past_paper_questions(browse_topic)
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            browse_topic = st.selectbox("Select topic to browse:", TOPICS + [ALL], key="browse_topic")
+        with col2:
+            browse_year = st.selectbox("Year:", [ALL] + facets["year"], key="browse_year")
+        with col3:
+            browse_paper = st.selectbox("Paper:", [ALL] + facets["paper"], key="browse_paper")
+        with col4:
+            browse_difficulty = st.selectbox("Difficulty:", [ALL] + DIFFICULTIES, key="browse_difficulty")
+        
+        show_past_paper_questions(
+            None if browse_topic == ALL else browse_topic,
+            browse_query,
+            None if browse_difficulty == ALL else browse_difficulty,
+            None if browse_year == ALL else browse_year,
+            None if browse_paper == ALL else browse_paper,
+        )
     else:
         st.error("📚 Exam index not loaded. Please upload exam-index.json to your Railway deployment to browse past paper questions.")
-        st.info("The exam index contains real LC past paper questions organized by topic, difficulty, and year.")
\ No newline at end of file
+        st.info("The exam index contains real LC past paper questions organized by topic, difficulty, and year.")
+
+
+# -----------------------------
+# ADMIN PANEL
+# -----------------------------
+# Only shown at ?admin=<ADMIN_TOKEN>, and only when ADMIN_TOKEN is set
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+if ADMIN_TOKEN and st.query_params.get("admin") == ADMIN_TOKEN:
+    st.markdown("---")
+    with st.expander("📊 Claude usage (this server process)", expanded=True):
+        by_topic = METRICS.summary("topic")
+        calls = sum(row["calls"] for row in by_topic)
+        spend = sum(row["spend_usd"] for row in by_topic)
+        st.caption(f"Last {calls} calls · ${spend:.2f} estimated spend · latency over uncached calls only")
+
+        st.markdown("**By topic**")
+        st.dataframe(by_topic, use_container_width=True, hide_index=True)
+        st.markdown("**By generator**")
+        st.dataframe(METRICS.summary("generator"), use_container_width=True, hide_index=True)
+        st.markdown("**By model**")
+        st.dataframe(METRICS.summary("model"), use_container_width=True, hide_index=True)
+
+        st.markdown("**Services**")
+        st.json({
+            "circuit_breaker": BREAKER.stats(),
+            "in_flight": IN_FLIGHT.stats(),
+            "worksheet_pool": WORKSHEET_POOL.stats(),
+            "answer_prefetch": ANSWER_PREFETCHER.stats(),
+            "request_scheduler": SCHEDULER.stats(),
+            "prompt_cache": prompt_cache_stats(),
+            "question_bank": QUESTION_BANK.stats(),
+        }, expanded=False)
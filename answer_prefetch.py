@@ -0,0 +1,201 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+
+from request_scheduler import PREFETCH, set_request_context
+
+# Speculative answers for the worksheet a student is looking at. Once a
+# worksheet is on screen, a few background workers generate worked solutions
+# for its first questions, so a later "Show Answer" renders at once. Opt-in
+# (ANSWER_PREFETCH=1), since answers nobody opens are paid for anyway.
+
+PREFETCH_ENABLED = os.environ.get("ANSWER_PREFETCH", "0") == "1"
+PREFETCH_BUDGET = int(os.environ.get("ANSWER_PREFETCH_BUDGET", 3))  # answers per session per worksheet
+PREFETCH_WORKERS = int(os.environ.get("ANSWER_PREFETCH_WORKERS", 2))
+# Prefetching waits while this many generations are already running
+PREFETCH_MAX_LOAD = int(os.environ.get("ANSWER_PREFETCH_MAX_LOAD", 20))
+PREFETCH_BACKOFF = 0.5  # seconds between load checks
+
+
+class _Worksheet:
+    """One session's prefetch state for its current worksheet"""
+
+    def __init__(self, questions, topic, difficulty, is_active):
+        self.questions = questions
+        self.topic = topic
+        self.difficulty = difficulty
+        self.is_active = is_active
+        self.queue = deque()
+        self.answers = {}  # index -> answer text
+        self.running = set()
+        self.taken = set()
+        self.cancelled = threading.Event()
+
+
+class AnswerPrefetcher:
+    """Per-session answer prefetch, served round-robin across sessions"""
+
+    def __init__(self, generate, load=None, enabled=PREFETCH_ENABLED, budget=PREFETCH_BUDGET,
+                 workers=PREFETCH_WORKERS, max_load=PREFETCH_MAX_LOAD):
+        """`generate(question, topic, difficulty)` yields answer text; `load()`
+        is how many generations are running right now"""
+        self.generate = generate
+        self.load = load or (lambda: 0)
+        self.enabled = enabled and budget > 0 and workers > 0
+        self.budget = budget
+        self.workers = workers
+        self.max_load = max_load
+        self.scheduled = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.errors = 0
+        self.wasted = 0
+        self.hits = 0
+        self.in_flight_hits = 0
+        self.misses = 0
+        # session id -> _Worksheet; sessions with queued work are served in turn
+        self._sessions = OrderedDict()
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def schedule(self, session_id, questions, topic, difficulty, is_active=None):
+        """Prefetch answers to the first `budget` of `questions` (markdown),
+        replacing whatever this session was prefetching before.
+        `is_active()` returning False stops work for a session that has left."""
+        if not self.enabled:
+            return
+        worksheet = _Worksheet(list(questions), topic, difficulty, is_active or (lambda: True))
+        worksheet.queue.extend(range(min(self.budget, len(worksheet.questions))))
+        with self._cond:
+            self._drop(session_id)
+            for other in [s for s, w in self._sessions.items() if not w.is_active()]:
+                self._drop(other)  # sessions that left without starting a new worksheet
+            self._sessions[session_id] = worksheet
+            self.scheduled += len(worksheet.queue)
+            self._ensure_workers()
+            self._cond.notify_all()
+
+    def cancel(self, session_id):
+        """Stop prefetching for this session (new worksheet, or it left)"""
+        with self._cond:
+            self._drop(session_id)
+
+    def _drop(self, session_id):
+        worksheet = self._sessions.pop(session_id, None)
+        if worksheet is None:
+            return
+        worksheet.cancelled.set()
+        self.cancelled += len(worksheet.queue) + len(worksheet.running)
+        self.wasted += len(set(worksheet.answers) - worksheet.taken)
+
+    def take(self, session_id, index, question):
+        """The prefetched answer to question `index`, or None. Called when the
+        student asks for it, so this is where hits and misses are counted."""
+        if not self.enabled:
+            return None
+        with self._cond:
+            worksheet = self._sessions.get(session_id)
+            if worksheet is None or index >= len(worksheet.questions) or worksheet.questions[index] != question:
+                self.misses += 1
+                return None
+            answer = worksheet.answers.get(index)
+            if answer is not None:
+                self.hits += 1
+                worksheet.taken.add(index)
+            elif index in worksheet.running:
+                # Still being written; the answer call joins it (see IN_FLIGHT)
+                self.in_flight_hits += 1
+                worksheet.taken.add(index)
+            else:
+                self.misses += 1
+                if index in worksheet.queue:
+                    worksheet.queue.remove(index)  # the student's own request will make it
+            return answer
+
+    def _ensure_workers(self):
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work_loop, name="answer-prefetch", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_task(self):
+        # Round-robin: take one question from the longest-waiting session
+        for session_id, worksheet in self._sessions.items():
+            if worksheet.queue:
+                self._sessions.move_to_end(session_id)
+                index = worksheet.queue.popleft()
+                worksheet.running.add(index)
+                return session_id, worksheet, index
+        return None
+
+    def _work_loop(self):
+        while True:
+            # Interactive requests come first: wait while the service is busy
+            while self.load() >= self.max_load:
+                time.sleep(PREFETCH_BACKOFF)
+
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    self._cond.wait()
+                    task = self._next_task()
+            session_id, worksheet, index = task
+            set_request_context(session_id, PREFETCH)
+
+            answer = self._generate(worksheet, index)
+
+            with self._cond:
+                worksheet.running.discard(index)
+                if worksheet.cancelled.is_set():
+                    continue
+                if not worksheet.is_active():
+                    if self._sessions.get(session_id) is worksheet:
+                        self._drop(session_id)
+                    continue
+                if answer is None:
+                    self.errors += 1
+                    continue
+                worksheet.answers[index] = answer
+                self.completed += 1
+
+    def _generate(self, worksheet, index):
+        """The answer text, or None if it failed or the session moved on"""
+        if worksheet.cancelled.is_set() or not worksheet.is_active():
+            return None
+        stream = self.generate(worksheet.questions[index], worksheet.topic, worksheet.difficulty)
+        chunks = []
+        try:
+            for chunk in stream:
+                if worksheet.cancelled.is_set() or not worksheet.is_active():
+                    return None  # closing the stream cancels the request
+                chunks.append(chunk)
+        except Exception:
+            return None
+        finally:
+            stream.close()
+        return "".join(chunks)
+
+    def stats(self):
+        with self._cond:
+            sessions = len(self._sessions)
+            queued = sum(len(w.queue) for w in self._sessions.values())
+            running = sum(len(w.running) for w in self._sessions.values())
+        clicks = self.hits + self.in_flight_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "sessions": sessions,
+            "queued": queued,
+            "running": running,
+            "scheduled": self.scheduled,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "errors": self.errors,
+            "wasted": self.wasted,
+            "hits": self.hits,
+            "in_flight_hits": self.in_flight_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / clicks if clicks else 0.0,
+            "used_rate": self.hits / self.completed if self.completed else 0.0,
+        }
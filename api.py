@@ -0,0 +1,185 @@
+"""HTTP API over the generators, so generation can scale apart from Streamlit.
+
+    uvicorn api:app --workers 4
+
+JSON endpoints return the full result; the /stream variants send
+server-sent events as the text arrives. Generation endpoints are async and
+await Claude on the event loop, so a worker isn't limited to one
+generation per threadpool thread.
+"""
+import json
+from typing import List, Optional
+
+from anthropic import APIError
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from claude_client import BREAKER, CircuitOpenError
+from exam_index import INDEX_STORE
+from metrics import METRICS
+from request_scheduler import SCHEDULER
+from generators import (
+    TOPICS,
+    SUBTOPICS,
+    agenerate_worksheet,
+    astream_worksheet,
+    agenerate_answer,
+    astream_answer,
+    agenerate_similar_question,
+    agenerate_exam_style_worksheet,
+)
+
+app = FastAPI(title="Leaving Certificate Honours Maths")
+
+
+class WorksheetRequest(BaseModel):
+    topic: str
+    subtopics: List[str] = []
+    difficulty: str = "Medium"
+
+
+class QuestionRequest(BaseModel):
+    question: str
+    topic: str
+    difficulty: str = "Medium"
+
+
+class ExamStyleRequest(BaseModel):
+    topic: str
+    subtopics: List[str] = []
+
+
+def _check_topic(topic):
+    if topic not in TOPICS:
+        raise HTTPException(status_code=404, detail=f"Unknown topic: {topic}")
+
+
+def _unavailable(error):
+    retry_after = max(1, int(BREAKER.cooldown))
+    return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(retry_after)})
+
+
+def _failed(error):
+    """Claude rejected or failed the request itself"""
+    return HTTPException(status_code=502, detail=f"Generation failed ({type(error).__name__})")
+
+
+async def _sse(events):
+    """Encode (event, data) pairs as server-sent events, ending with 'done' or 'error'"""
+    try:
+        async for event, data in events:
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    except CircuitOpenError as error:
+        yield f"event: error\ndata: {json.dumps({'detail': str(error)})}\n\n"
+        return
+    except APIError as error:
+        yield f"event: error\ndata: {json.dumps({'detail': _failed(error).detail})}\n\n"
+        return
+    yield "event: done\ndata: {}\n\n"
+
+
+def _event_stream(events):
+    return StreamingResponse(_sse(events), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+# -----------------------------
+# META
+# -----------------------------
+@app.get("/health")
+def health():
+    return {"status": "ok", "circuit": BREAKER.state}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint (counters are per worker process)"""
+    return METRICS.prometheus() + SCHEDULER.prometheus()
+
+
+@app.get("/topics")
+def topics():
+    return {"topics": TOPICS, "subtopics": SUBTOPICS}
+
+
+# -----------------------------
+# GENERATORS
+# -----------------------------
+@app.post("/worksheet")
+async def worksheet(request: WorksheetRequest):
+    _check_topic(request.topic)
+    try:
+        questions = await agenerate_worksheet(request.topic, request.subtopics, request.difficulty)
+        return {"questions": [q.to_dict() for q in questions]}
+    except CircuitOpenError as error:
+        raise _unavailable(error)
+    except APIError as error:
+        raise _failed(error)
+
+
+@app.post("/worksheet/stream")
+async def worksheet_stream(request: WorksheetRequest):
+    _check_topic(request.topic)
+    questions = astream_worksheet(request.topic, request.subtopics, request.difficulty)
+    return _event_stream(("question", q.to_dict()) async for q in questions)
+
+
+@app.post("/answer")
+async def answer(request: QuestionRequest):
+    _check_topic(request.topic)
+    try:
+        return {"answer": await agenerate_answer(request.question, request.topic, request.difficulty)}
+    except CircuitOpenError as error:
+        raise _unavailable(error)
+    except APIError as error:
+        raise _failed(error)
+
+
+@app.post("/answer/stream")
+async def answer_stream(request: QuestionRequest):
+    _check_topic(request.topic)
+    chunks = astream_answer(request.question, request.topic, request.difficulty)
+    return _event_stream(("delta", {"text": chunk}) async for chunk in chunks)
+
+
+@app.post("/similar")
+async def similar(request: QuestionRequest):
+    _check_topic(request.topic)
+    try:
+        return {"question": await agenerate_similar_question(request.question, request.topic, request.difficulty)}
+    except CircuitOpenError as error:
+        raise _unavailable(error)
+    except APIError as error:
+        raise _failed(error)
+
+
+@app.post("/exam-style")
+async def exam_style(request: ExamStyleRequest):
+    _check_topic(request.topic)
+    try:
+        questions = await agenerate_exam_style_worksheet(request.topic, request.subtopics)
+        return {"questions": [q.to_dict() for q in questions]}
+    except CircuitOpenError as error:
+        raise _unavailable(error)
+    except APIError as error:
+        raise _failed(error)
+
+
+# -----------------------------
+# PAST PAPERS
+# -----------------------------
+@app.get("/past-papers")
+def past_papers(
+    topic: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    year: Optional[int] = None,
+    paper: Optional[str] = None,
+    limit: int = 50,
+    offset: int = 0,
+):
+    index = INDEX_STORE.get_question_index()
+    ids = index.lookup(topic, difficulty, year, paper)
+    return {
+        "total": len(ids),
+        "questions": [index.questions[i] for i in ids[offset:offset + limit]],
+    }
@@ -0,0 +1,168 @@
+"""Batch-generate worksheets into the local question bank.
+
+Enumerates every topic / subtopic / difficulty in generators.TOPICS and
+SUBTOPICS, submits the worksheet and exam-style prompts as one Message
+Batches job, polls until it ends, then files the parsed questions into the
+question bank the app serves from.
+
+    python batch_generate.py                   # submit, poll and ingest
+    python batch_generate.py --topic Calculus  # just one topic
+    python batch_generate.py --resume msgbatch_...
+    python batch_generate.py --local           # local stand-in, no API calls
+    python batch_generate.py --dry-run         # count requests only
+"""
+import time
+import argparse
+from types import SimpleNamespace
+
+from generators import (
+    TOPICS,
+    SUBTOPICS,
+    worksheet_prompts,
+    exam_style_prompts,
+)
+from claude_client import make_client
+from model_routing import route
+from question_bank import QUESTION_BANK, ALL_SUBTOPICS
+from worksheet_format import Question, parse_questions
+
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+EXAM_STYLE = "Exam Style"
+
+
+# -----------------------------
+# REQUEST MATRIX
+# -----------------------------
+def build_requests(topics=TOPICS):
+    """Return ({custom_id: (topic, subtopic, difficulty)}, [batch request params])"""
+    meta = {}
+    requests = []
+
+    for topic in topics:
+        # Each subtopic on its own, plus the whole topic (same as Lucky Dip)
+        subtopic_sets = [[s] for s in SUBTOPICS.get(topic, [])] + [SUBTOPICS.get(topic, [])]
+        for chosen in subtopic_sets:
+            subtopic = chosen[0] if len(chosen) == 1 else ALL_SUBTOPICS
+            for difficulty in DIFFICULTIES + [EXAM_STYLE]:
+                if difficulty == EXAM_STYLE:
+                    system_prompt, user_prompt = exam_style_prompts(topic, chosen)
+                    chosen_route = route("exam_style")
+                else:
+                    system_prompt, user_prompt = worksheet_prompts(topic, chosen, difficulty)
+                    chosen_route = route("worksheet", difficulty)
+
+                custom_id = f"q{len(requests):06d}"
+                meta[custom_id] = (topic, subtopic, difficulty)
+                requests.append({
+                    "custom_id": custom_id,
+                    "params": {
+                        "model": chosen_route.model,
+                        "max_tokens": chosen_route.max_tokens,
+                        "system": system_prompt,
+                        "messages": [{"role": "user", "content": user_prompt}],
+                    },
+                })
+
+    return meta, requests
+
+
+# -----------------------------
+# LOCAL STAND-IN CLIENT
+# -----------------------------
+class LocalBatchClient:
+    """Mimics client.messages.batches with canned responses, for testing without the API"""
+
+    def __init__(self):
+        self._batches = {}
+        self.messages = SimpleNamespace(batches=self)
+
+    def create(self, requests):
+        batch_id = f"msgbatch_local_{len(self._batches) + 1}"
+        self._batches[batch_id] = list(requests)
+        return self.retrieve(batch_id)
+
+    def retrieve(self, batch_id):
+        count = len(self._batches[batch_id])
+        return SimpleNamespace(
+            id=batch_id,
+            processing_status="ended",
+            request_counts=SimpleNamespace(processing=0, succeeded=count, errored=0, canceled=0, expired=0),
+        )
+
+    def results(self, batch_id):
+        for request in self._batches[batch_id]:
+            prompt = request["params"]["messages"][0]["content"].splitlines()[0].split(". ")[0]
+            # JSON Lines, as the worksheet and exam-style prompts ask for
+            text = "\n".join(
+                Question(f"[{request['custom_id']}] {prompt}: question {n} with $x^{n}$").to_json()
+                for n in range(1, 11)
+            )
+            message = SimpleNamespace(content=[SimpleNamespace(type="text", text=text)])
+            yield SimpleNamespace(
+                custom_id=request["custom_id"],
+                result=SimpleNamespace(type="succeeded", message=message),
+            )
+
+
+# -----------------------------
+# SUBMIT / POLL / INGEST
+# -----------------------------
+def wait_for_batch(batches, batch_id, poll_interval):
+    while True:
+        batch = batches.retrieve(batch_id)
+        counts = batch.request_counts
+        print(
+            f"{batch_id}: {batch.processing_status} — "
+            f"{counts.succeeded} succeeded, {counts.errored} errored, {counts.processing} processing"
+        )
+        if batch.processing_status == "ended":
+            return batch
+        time.sleep(poll_interval)
+
+
+def ingest_results(batches, batch_id, meta):
+    added = failed = 0
+    for entry in batches.results(batch_id):
+        if entry.result.type != "succeeded" or entry.custom_id not in meta:
+            failed += 1
+            continue
+        topic, subtopic, difficulty = meta[entry.custom_id]
+        text = "".join(block.text for block in entry.result.message.content if block.type == "text")
+        # Banked as JSON records; Question.from_stored() reads them back
+        questions = [q.to_json() for q in parse_questions(text)]
+        added += QUESTION_BANK.add_questions(topic, subtopic, difficulty, questions, batch_id=batch_id)
+    return added, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--topic", action="append", choices=TOPICS, help="limit to these topics (repeatable)")
+    parser.add_argument("--resume", metavar="BATCH_ID", help="poll and ingest an already submitted batch")
+    parser.add_argument("--poll-interval", type=float, default=60.0, help="seconds between status checks")
+    parser.add_argument("--local", action="store_true", help="use the local stand-in client instead of the API")
+    parser.add_argument("--dry-run", action="store_true", help="print the request count and exit")
+    args = parser.parse_args(argv)
+
+    batches = (LocalBatchClient() if args.local else make_client()).messages.batches
+
+    if args.resume:
+        batch_id = args.resume
+        meta = QUESTION_BANK.batch_requests(batch_id)
+        if not meta:
+            parser.error(f"no recorded requests for {batch_id}")
+    else:
+        meta, requests = build_requests(args.topic or TOPICS)
+        print(f"{len(requests)} requests across {len(args.topic or TOPICS)} topics")
+        if args.dry_run:
+            return
+        batch_id = batches.create(requests=requests).id
+        QUESTION_BANK.record_requests(batch_id, meta)
+        print(f"Submitted {batch_id}")
+
+    wait_for_batch(batches, batch_id, args.poll_interval)
+    added, failed = ingest_results(batches, batch_id, meta)
+    print(f"Added {added} new questions ({failed} requests failed); bank now {QUESTION_BANK.stats()}")
+
+
+if __name__ == "__main__":
+    main()
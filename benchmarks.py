@@ -0,0 +1,308 @@
+"""Microbenchmarks for the app's hot non-network paths, checked against a baseline.
+
+Times index loading (JSON and compact), template lookup, prompt formatting
+and the past-paper browser's page work on the real index files and on
+synthetic corpora built by copying them into more years (10x, 100x, 1000x).
+Each benchmark records its fastest and median seconds per call plus the peak
+memory and the blocks it allocates (tracemalloc, measured in a separate
+untimed call).
+
+    python benchmarks.py                      # compare with benchmarks.baseline.json
+    python benchmarks.py --save               # record a new baseline
+    python benchmarks.py --scales 1 10        # skip the big corpora
+    python benchmarks.py --threshold 1.3 --json results.json   # on a quiet machine
+
+Exits 1 if any benchmark is slower than --threshold times its baseline or
+allocates more than --alloc-threshold times as much, or if one that should
+stay nearly flat grows too fast with the corpus (SCALING, checked with or
+without a baseline). Baseline timings belong to the machine that recorded
+them; re-record with --save after moving.
+"""
+import gc
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BASE_DIR, "benchmarks.baseline.json")
+
+DEFAULT_SCALES = [1, 10, 100, 1000]
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+PAGE_SIZE = 10  # Home.PAST_PAPER_PAGE_SIZE
+
+# A time regression smaller than this is noise, whatever the ratio
+MIN_TIME_REGRESSION = 50e-6
+
+# Benchmarks that must grow slower than the corpus: at scale N, each may take
+# at most N ** exponent times as long as on the real index (the JSON load
+# grows with exponent ~1; the compact load still stats every file)
+SCALING = {
+    "find_template_questions": 0.9,
+    "load_compact_index": 0.75,
+}
+
+
+# -----------------------------
+# CORPORA
+# -----------------------------
+def real_files():
+    from exam_index import discover_index_files
+    return [os.path.join(BASE_DIR, f) for f in discover_index_files()]
+
+
+def synthetic_files(sources, scale, out_dir):
+    """Write `scale` copies of every source file, each copy moved forward by
+    the corpus's span of years so no question collides with another copy's
+    (forward, as the compact index stores years unsigned)"""
+    corpora = []
+    for path in sources:
+        with open(path) as f:
+            corpora.append(json.load(f))
+    years = [int(q["paper"]["year"]) for data in corpora for q in data["questions"]
+             if str(q.get("paper", {}).get("year", "")).isdigit()]
+    span = (max(years) - min(years) + 1) if years else 1
+
+    files = []
+    for copy in range(scale):
+        for n, data in enumerate(corpora):
+            questions = []
+            for q in data["questions"]:
+                paper = dict(q.get("paper", {}))
+                if str(paper.get("year", "")).isdigit():
+                    paper["year"] = int(paper["year"]) + copy * span
+                questions.append({**q, "paper": paper})
+            path = os.path.join(out_dir, f"exam-index-{copy:04d}-{n}.json")
+            with open(path, "w") as f:
+                json.dump({**data, "questions": questions, "total_questions": len(questions)}, f)
+            files.append(path)
+    return files
+
+
+# -----------------------------
+# BENCHMARKS
+# -----------------------------
+def benchmarks(files, compact_path):
+    """[(name, zero-argument callable)] over the corpus in `files` and its
+    compact build at `compact_path`"""
+    import generators
+    from exam_index import ExamIndexStore, QuestionIndex, load_all_exam_indexes
+
+    store = ExamIndexStore(files=files, compact_path="")
+    index = store.get()
+    question_index = store.get_question_index()
+
+    def find_templates():
+        # find_template_questions reads the process-wide store; point it at ours
+        shared, generators.INDEX_STORE = generators.INDEX_STORE, store
+        try:
+            return generators.find_template_questions(
+                "Probability", "Medium", ["Expected value", "Binomial distribution"]
+            )
+        finally:
+            generators.INDEX_STORE = shared
+
+    templates = find_templates()
+
+    def load_compact():
+        # What a process start (or a changed file) costs with the compact build
+        compact = ExamIndexStore(files=files, compact_path=compact_path)
+        compact.get()
+        assert compact.format == "compact", "compact build is stale"
+        return compact
+
+    def past_paper_page(query="", topic=None):
+        # The data work of show_past_paper_questions + display_past_paper_list
+        # for the first page of the first level, without the Streamlit calls
+        matching = question_index.search(query, topic)
+        grouped = question_index.split_by_difficulty(matching, DIFFICULTIES)
+        rendered = []
+        for qid in grouped[DIFFICULTIES[0]][:PAGE_SIZE]:
+            q = question_index.questions[qid]
+            paper = q.get('paper', {})
+            key = f"past_{paper.get('year', 'N/A')}_{paper.get('paper', 'N/A').replace(' ', '')}_{q.get('questionNumber', 'N/A')}"
+            label = f"Q{q.get('questionNumber', 'N/A')} - {q.get('description', 'No description')[:60]}..."
+            rendered.append((key, label, question_index.details_markdown(qid)))
+        return rendered
+
+    return [
+        ("load_all_exam_indexes", lambda: load_all_exam_indexes(files)),
+        ("load_compact_index", load_compact),
+        ("build_question_index", lambda: QuestionIndex(index["questions"]).text_index),
+        ("find_template_questions", find_templates),
+        ("format_template_for_prompt", lambda: generators.format_template_for_prompt(templates)),
+        ("past_paper_page", lambda: past_paper_page(topic="Probability")),
+        ("past_paper_page_all", lambda: past_paper_page()),
+        ("past_paper_search", lambda: past_paper_page("expected value distribution")),
+    ]
+
+
+def time_call(fn, min_time, min_rounds):
+    """(fastest, median) seconds per call over the rounds after one warm-up
+    call. The fastest is what gets compared: it is the least disturbed by
+    whatever else the machine is doing. Like timeit, runs with the garbage
+    collector off, so a collection triggered by earlier work isn't billed here."""
+    fn()
+    samples = []
+    gc.collect()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        while len(samples) < min_rounds or time.perf_counter() - started < min_time:
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return min(samples), statistics.median(samples), len(samples)
+
+
+def trace_call(fn):
+    """(peak KB traced during one call, memory blocks allocated by it and still live)"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    blocks = sum(max(0, stat.count_diff) for stat in after.compare_to(before, "filename"))
+    return round(peak / 1024, 1), blocks
+
+
+def run(scales, min_time, min_rounds):
+    import compact_index
+    from exam_index import load_all_exam_indexes
+
+    sources = real_files()
+    results = {}
+    scratch = tempfile.mkdtemp(prefix="benchmarks-")
+    try:
+        for scale in scales:
+            out_dir = os.path.join(scratch, f"x{scale}")
+            os.makedirs(out_dir)
+            files = sources if scale == 1 else synthetic_files(sources, scale, out_dir)
+            compact_path = os.path.join(out_dir, "exam-index.compact")
+            compact_index.build(load_all_exam_indexes(files), {f: os.path.join(BASE_DIR, f) for f in files}, compact_path)
+            corpus = f"x{scale}"
+            for name, fn in benchmarks(files, compact_path):
+                seconds, median, rounds = time_call(fn, min_time, min_rounds)
+                peak_kb, blocks = trace_call(fn)
+                results[f"{corpus}/{name}"] = {
+                    "seconds": seconds,
+                    "median_seconds": median,
+                    "rounds": rounds,
+                    "peak_kb": peak_kb,
+                    "blocks": blocks,
+                }
+                print(f"{corpus:<7}{name:<28}{seconds * 1000:>11.3f} ms{median * 1000:>11.3f} ms{peak_kb:>12.1f} KB{blocks:>10} blocks",
+                      flush=True)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return results
+
+
+# -----------------------------
+# BASELINE
+# -----------------------------
+def compare(results, baseline, threshold, alloc_threshold):
+    """Human-readable regressions of `results` against `baseline`"""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result["seconds"] > base["seconds"] * threshold and result["seconds"] - base["seconds"] > MIN_TIME_REGRESSION:
+            regressions.append(f"{key}: {result['seconds'] * 1000:.3f} ms vs {base['seconds'] * 1000:.3f} ms baseline")
+        for field, unit in (("peak_kb", "KB peak"), ("blocks", "blocks")):
+            # A floor of 64 KB / 64 blocks keeps tiny allocations from flapping
+            if result[field] > max(base[field] * alloc_threshold, base[field] + 64):
+                regressions.append(f"{key}: {result[field]} {unit} vs {base[field]} baseline")
+    return regressions
+
+
+def check_scaling(results):
+    """Benchmarks in SCALING that grew faster with the corpus than allowed"""
+    failures = []
+    for name, exponent in SCALING.items():
+        base = results.get(f"x1/{name}")
+        if base is None:
+            continue
+        for key, result in results.items():
+            corpus, _, bench = key.partition("/")
+            scale = int(corpus[1:])
+            if bench != name or scale == 1:
+                continue
+            limit = base["seconds"] * scale ** exponent
+            if result["seconds"] > limit:
+                failures.append(f"{key}: {result['seconds'] * 1000:.3f} ms, over {limit * 1000:.3f} ms "
+                                f"(x1 time * {scale}^{exponent})")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="corpus sizes as multiples of the real one")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to spend timing each benchmark")
+    parser.add_argument("--min-rounds", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=2.0, help="fail if slower than this times the baseline")
+    parser.add_argument("--alloc-threshold", type=float, default=1.2, help="fail if allocating more than this times the baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    # Keep generators' import from touching the real caches (each benchmark
+    # store is given its own files and compact build)
+    os.environ.setdefault("METRICS_LOG_PATH", "")
+    os.environ.setdefault("WORKSHEET_POOL_SIZE", "0")
+    sys.path.insert(0, BASE_DIR)
+
+    print(f"{'corpus':<7}{'benchmark':<28}{'fastest':>14}{'median':>14}{'peak':>15}{'allocated':>17}")
+    results = run(args.scales, args.min_time, args.min_rounds)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    scaling = check_scaling(results)
+    if scaling:
+        print(f"\n{len(scaling)} benchmarks grew too fast with the corpus:")
+        for line in scaling:
+            print(f"  {line}")
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": platform.platform(), "python": platform.python_version(), "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return 1 if scaling else 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; record one with --save")
+        return 1 if scaling else 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline["results"], args.threshold, args.alloc_threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regressions against {args.baseline}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    if scaling:
+        return 1
+    print(f"\nNo regressions against {args.baseline} (recorded on {baseline.get('machine')})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
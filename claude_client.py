@@ -0,0 +1,136 @@
+import os
+import time
+import threading
+from anthropic import (
+    Anthropic,
+    AsyncAnthropic,
+    APIConnectionError,
+    APIStatusError,
+    DefaultHttpxClient,
+    DefaultAsyncHttpxClient,
+    Timeout,
+    DEFAULT_CONNECTION_LIMITS,
+)
+
+# Client settings and the circuit breaker. The process-wide client is the
+# async one owned by generation_service.py, shared by every session, so
+# connections stay alive between calls instead of paying a TLS handshake.
+
+CLAUDE_TIMEOUT = float(os.environ.get("CLAUDE_TIMEOUT", 90))  # seconds, whole request
+CLAUDE_CONNECT_TIMEOUT = float(os.environ.get("CLAUDE_CONNECT_TIMEOUT", 5))
+# The SDK retries 408/409/429/5xx (incl. 529 overloaded) with jittered
+# exponential backoff, honouring retry-after headers
+CLAUDE_MAX_RETRIES = int(os.environ.get("CLAUDE_MAX_RETRIES", 3))
+CLAUDE_MAX_CONNECTIONS = int(os.environ.get("CLAUDE_MAX_CONNECTIONS", 64))
+CLAUDE_KEEPALIVE_CONNECTIONS = int(os.environ.get("CLAUDE_KEEPALIVE_CONNECTIONS", 32))
+
+BREAKER_THRESHOLD = int(os.environ.get("CLAUDE_BREAKER_THRESHOLD", 5))  # consecutive failures
+BREAKER_COOLDOWN = float(os.environ.get("CLAUDE_BREAKER_COOLDOWN", 30))  # seconds open
+
+# httpx.Limits from whichever httpx build the SDK itself uses
+Limits = type(DEFAULT_CONNECTION_LIMITS)
+
+
+def _limits():
+    return Limits(
+        max_connections=CLAUDE_MAX_CONNECTIONS,
+        max_keepalive_connections=CLAUDE_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=60,
+    )
+
+
+def make_client():
+    """A sync client, for scripts such as batch_generate.py"""
+    return Anthropic(
+        api_key=os.environ.get("ANTHROPIC_API_KEY"),
+        timeout=Timeout(CLAUDE_TIMEOUT, connect=CLAUDE_CONNECT_TIMEOUT),
+        max_retries=CLAUDE_MAX_RETRIES,
+        http_client=DefaultHttpxClient(limits=_limits()),
+    )
+
+
+def make_async_client():
+    """Same settings as make_client(); must only be used from one event loop"""
+    return AsyncAnthropic(
+        api_key=os.environ.get("ANTHROPIC_API_KEY"),
+        timeout=Timeout(CLAUDE_TIMEOUT, connect=CLAUDE_CONNECT_TIMEOUT),
+        max_retries=CLAUDE_MAX_RETRIES,
+        http_client=DefaultAsyncHttpxClient(limits=_limits()),
+    )
+
+
+# -----------------------------
+# CIRCUIT BREAKER
+# -----------------------------
+class CircuitOpenError(Exception):
+    """Raised instead of calling Claude while the circuit breaker is open"""
+
+
+def is_transient(error):
+    """Rate limits, overload, server errors and network failures (after SDK retries)"""
+    if isinstance(error, APIConnectionError):  # includes timeouts
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+class CircuitBreaker:
+    """Fail fast after repeated transient failures, then let one trial call through"""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self.rejected = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial_in_flight):
+                self.rejected += 1
+                retry_in = max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+                raise CircuitOpenError(f"Claude is unavailable; retrying in {retry_in:.0f}s")
+            if state == "half-open":
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    self.trips += 1
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """The call ended without a verdict (cancelled, or a non-transient error)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+BREAKER = CircuitBreaker()
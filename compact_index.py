@@ -0,0 +1,311 @@
+"""Compact, memory-mapped build of the exam index.
+
+    python compact_index.py          # compile the discovered index files -> exam-index.compact
+
+Every string (descriptions, topics, "Higher Level", "Paper 1", ...) is stored
+once in a string table; questions are fixed-width uint32 columns of string
+ids and years, with topics/concepts as ranges into a shared id list. The
+filter postings (topic tag, difficulty, year, paper) and the full-text
+index's term postings and document lengths are stored too. The file is
+mmap'd, so opening it costs the same however many papers it holds, and a
+question or a posting list is only decoded when it is actually looked at.
+"""
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+from array import array
+from collections.abc import Mapping, Sequence
+
+from text_search import BM25Index
+
+MAGIC = b"LCXI"
+VERSION = 3
+HEADER = struct.Struct("<4sHHIIII")  # magic, version, reserved, questions, strings, refs, meta bytes
+ABSENT = 0xFFFFFFFF  # string id for an optional field the question doesn't have
+
+COLUMNS = [
+    "number", "description", "difficulty", "year", "level", "paper", "filename",
+    "topics_start", "topics_count", "concepts_start", "concepts_count",
+]
+# Stored postings: QuestionIndex's filters, then BM25 terms (which also store tfs)
+POSTINGS = ["tag", "difficulty", "year", "paper", "term"]
+
+
+def source_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def source_signature(path):
+    s = os.stat(path)
+    return {"size": s.st_size, "mtime_ns": s.st_mtime_ns, "sha256": source_digest(path)}
+
+
+def _u32(values):
+    a = array("I", values)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a.tobytes()
+
+
+def _pad(data):
+    return data + b"\0" * (-len(data) % 4)
+
+
+# -----------------------------
+# BUILD
+# -----------------------------
+def build(index, sources, out_path):
+    """Compile a merged EXAM_INDEX dict into `out_path`. `sources` maps each
+    index file name to its path, recorded so readers can tell a stale build.
+    Returns the question count."""
+    from exam_index import QuestionIndex
+
+    strings = {}
+
+    def intern(s):
+        s = str(s)
+        if s not in strings:
+            strings[s] = len(strings)
+        return strings[s]
+
+    columns = {name: [] for name in COLUMNS}
+    refs = []
+    signatures = {name: source_signature(path) for name, path in sources.items()}
+
+    for q in index["questions"]:
+        paper = q.get("paper", {})
+        columns["number"].append(intern(q.get("questionNumber", "N/A")))
+        columns["description"].append(intern(q.get("description", "")))
+        columns["difficulty"].append(intern(q.get("difficulty", "")))
+        columns["year"].append(int(paper.get("year", 0) or 0))
+        columns["level"].append(intern(paper.get("level", "")))
+        columns["paper"].append(intern(paper.get("paper", "")))
+        columns["filename"].append(intern(paper["filename"]) if "filename" in paper else ABSENT)
+        for field in ("topics", "concepts"):
+            values = q.get(field, [])
+            columns[f"{field}_start"].append(len(refs))
+            columns[f"{field}_count"].append(len(values))
+            refs.extend(intern(v) for v in values)
+
+    # Postings exactly as QuestionIndex would build them from the questions
+    question_index = QuestionIndex(index["questions"])
+    text_index = question_index.text_index
+    families = {
+        "tag": question_index.by_tag,
+        "difficulty": question_index.by_difficulty,
+        "year": question_index.by_year,
+        "paper": question_index.by_paper,
+        "term": text_index.postings,
+    }
+    postings = {}
+    for family, by_key in families.items():
+        keys, offsets, ids, tfs = [], [0], [], []
+        for key in sorted(by_key):
+            keys.append(intern(key))
+            doc_ids = sorted(by_key[key])
+            ids.extend(doc_ids)
+            if family == "term":
+                tfs.extend(by_key[key][i] for i in doc_ids)
+            offsets.append(len(ids))
+        postings[family] = (keys, offsets, ids, tfs)
+
+    meta = json.dumps({
+        "sources": signatures,
+        "topics": [intern(t) for t in index["topics"]],
+        "duplicates": index.get("duplicates", 0),
+        "postings": {family: [len(p[0]), len(p[2])] for family, p in postings.items()},
+        "avg_len": text_index.avg_len,
+    }).encode("utf-8")
+
+    blob = bytearray()
+    offsets = [0]
+    for s in strings:  # dicts keep insertion order, i.e. id order
+        blob += s.encode("utf-8")
+        offsets.append(len(blob))
+
+    n = len(columns["number"])
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, n, len(strings), len(refs), len(meta)))
+        f.write(_pad(meta))
+        f.write(_u32(offsets))
+        for name in COLUMNS:
+            f.write(_u32(columns[name]))
+        f.write(_u32(refs))
+        f.write(_u32(text_index.doc_len))
+        for family in POSTINGS:
+            keys, offsets, ids, tfs = postings[family]
+            f.write(_u32(keys) + _u32(offsets) + _u32(ids) + _u32(tfs))
+        f.write(bytes(blob))
+    os.replace(tmp_path, out_path)  # readers never see a half-written file
+    return n
+
+
+# -----------------------------
+# READ
+# -----------------------------
+class CompactQuestions(Sequence):
+    """Read-only list of question dicts, decoded on access from the mmap"""
+
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return self._index.n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._index.question(i)
+
+
+class StoredPostings(Mapping):
+    """{key: frozenset of ids} (or, with `tfs`, {key: {id: tf}}) over one
+    stored postings family, each key's list decoded on first use"""
+
+    def __init__(self, index, keys, offsets, ids, tfs=None):
+        self._slots = {index.string(sid): n for n, sid in enumerate(keys)}
+        self._offsets = offsets
+        self._ids = ids
+        self._tfs = tfs
+        self._cache = {}
+
+    def __getitem__(self, key):
+        value = self._cache.get(key)
+        if value is None:
+            n = self._slots[key]
+            start, end = self._offsets[n], self._offsets[n + 1]
+            if self._tfs is None:
+                value = frozenset(self._ids[start:end])
+            else:
+                value = dict(zip(self._ids[start:end], self._tfs[start:end]))
+            self._cache[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def __len__(self):
+        return len(self._slots)
+
+
+class CompactIndex:
+    """mmap'd compact exam index with the same question dict shape as the JSON files"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mm)
+
+        magic, version, _, self.n, n_strings, n_refs, meta_len = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} compact exam index")
+        pos = HEADER.size
+        self.meta = json.loads(bytes(buf[pos:pos + meta_len]).decode("utf-8"))
+        pos += meta_len + (-meta_len % 4)
+
+        def u32s(count):
+            nonlocal pos
+            view = buf[pos:pos + 4 * count].cast("I")
+            pos += 4 * count
+            return view
+
+        self._offsets = u32s(n_strings + 1)
+        self.columns = {name: u32s(self.n) for name in COLUMNS}
+        self._refs = u32s(n_refs)
+        self.doc_len = u32s(self.n)
+        self._postings = {}
+        for family in POSTINGS:
+            n_keys, n_ids = self.meta["postings"][family]
+            self._postings[family] = (u32s(n_keys), u32s(n_keys + 1), u32s(n_ids),
+                                      u32s(n_ids) if family == "term" else None)
+        self._blob = buf[pos:]
+        self._strings = {}
+
+    def string(self, sid):
+        s = self._strings.get(sid)
+        if s is None:
+            s = self._strings[sid] = bytes(self._blob[self._offsets[sid]:self._offsets[sid + 1]]).decode("utf-8")
+        return s
+
+    def _string_list(self, field, i):
+        start = self.columns[f"{field}_start"][i]
+        return [self.string(sid) for sid in self._refs[start:start + self.columns[f"{field}_count"][i]]]
+
+    def question(self, i):
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError(i)
+        c = self.columns
+        paper = {"year": c["year"][i], "level": self.string(c["level"][i]), "paper": self.string(c["paper"][i])}
+        if c["filename"][i] != ABSENT:
+            paper["filename"] = self.string(c["filename"][i])
+        return {
+            "questionNumber": self.string(c["number"][i]),
+            "topics": self._string_list("topics", i),
+            "difficulty": self.string(c["difficulty"][i]),
+            "concepts": self._string_list("concepts", i),
+            "description": self.string(c["description"][i]),
+            "paper": paper,
+        }
+
+    @property
+    def topics(self):
+        return [self.string(sid) for sid in self.meta["topics"]]
+
+    def postings(self):
+        """QuestionIndex's (by_tag, by_difficulty, by_year, by_paper) maps, read from the file"""
+        return tuple(StoredPostings(self, *self._postings[family][:3]) for family in POSTINGS[:4])
+
+    def text_index(self):
+        """The BM25 index over the questions, read from the file"""
+        return BM25Index.from_postings(StoredPostings(self, *self._postings["term"]),
+                                       self.doc_len, self.meta["avg_len"])
+
+    def is_current(self, sources):
+        """True if built from exactly these source files ({name: path}). A file
+        whose size and mtime are unchanged is taken as current without hashing."""
+        recorded = self.meta.get("sources", {})
+        if set(recorded) != set(sources):
+            return False
+        for name, path in sources.items():
+            try:
+                s = os.stat(path)
+            except OSError:
+                return False
+            built = recorded[name]
+            if s.st_size != built["size"]:
+                return False
+            if s.st_mtime_ns != built["mtime_ns"] and source_digest(path) != built["sha256"]:
+                return False
+        return True
+
+    def as_exam_index(self):
+        """The EXAM_INDEX dict shape, with questions decoded lazily"""
+        return {
+            "total_questions": self.n,
+            "topics": self.topics,
+            "questions": CompactQuestions(self),
+            "duplicates": self.meta.get("duplicates", 0),
+        }
+
+
+def main(argv=None):
+    from exam_index import BASE_DIR, COMPACT_PATH, discover_index_files, load_all_exam_indexes
+
+    files = discover_index_files()
+    index = load_all_exam_indexes(files)
+    n = build(index, {f: os.path.join(BASE_DIR, f) for f in files}, COMPACT_PATH)
+    print(f"Compiled {n} questions from {len(files)} files ({index['duplicates']} duplicates dropped) into {COMPACT_PATH} ({os.path.getsize(COMPACT_PATH) / 1024:.0f} KB)")
+
+
+if __name__ == "__main__":
+    main()
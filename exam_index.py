@@ -0,0 +1,450 @@
+import os
+import json
+import time
+import glob
+import heapq
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from compact_index import CompactIndex
+from text_search import BM25Index, question_text, tokenize
+
+# Streamlit re-runs Home.py on every click, but imported modules are only
+# loaded once per process — so anything kept here is shared by every session.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Built by `python compact_index.py`; used instead of the JSON when it is current
+COMPACT_PATH = os.environ.get("EXAM_INDEX_COMPACT_PATH", os.path.join(BASE_DIR, "exam-index.compact"))
+
+# Index files are discovered rather than listed: one path or glob per line in
+# exam-index.manifest if it exists, otherwise these patterns (relative to BASE_DIR)
+MANIFEST_PATH = os.environ.get("EXAM_INDEX_MANIFEST", os.path.join(BASE_DIR, "exam-index.manifest"))
+DEFAULT_INDEX_PATTERNS = [
+    'JSON Files/*.json',
+    'exam-index*.json',
+]
+INDEX_LOAD_WORKERS = int(os.environ.get("EXAM_INDEX_LOAD_WORKERS", 8))
+# Every Streamlit rerun and template lookup asks for the index; the files are
+# stat'ed for changes at most this often (seconds)
+CHECK_INTERVAL = float(os.environ.get("EXAM_INDEX_CHECK_INTERVAL", 1.0))
+
+
+# -----------------------------
+# LOAD EXAM INDEX
+# -----------------------------
+def index_patterns():
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH, 'r') as f:
+            lines = [line.strip() for line in f]
+        return [line for line in lines if line and not line.startswith('#')]
+    return list(DEFAULT_INDEX_PATTERNS)
+
+
+def discover_index_files(missing=None):
+    """Index files named by the manifest (or default patterns), in pattern order.
+    Plain paths that don't exist are appended to `missing`."""
+    files = []
+    for pattern in index_patterns():
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(os.path.join(BASE_DIR, pattern)))
+            names = [os.path.relpath(m, BASE_DIR) for m in matches]
+        elif os.path.exists(os.path.join(BASE_DIR, pattern)):
+            names = [pattern]
+        else:
+            names = []
+            if missing is not None:
+                missing.append(pattern)
+        files.extend(n for n in names if n not in files)
+    return files
+
+
+def read_index_file(filename):
+    with open(os.path.join(BASE_DIR, filename), 'r') as f:
+        return json.load(f)
+
+
+def read_index_files(files, missing=None):
+    """Parse `files` in parallel; returns {filename: data} for those that exist"""
+    parsed = {}
+    if not files:
+        return parsed
+    with ThreadPoolExecutor(max_workers=min(INDEX_LOAD_WORKERS, len(files))) as pool:
+        futures = {filename: pool.submit(read_index_file, filename) for filename in files}
+    for filename, future in futures.items():
+        try:
+            parsed[filename] = future.result()
+        except FileNotFoundError:
+            if missing is not None:
+                missing.append(filename)
+    return parsed
+
+
+def question_key(q):
+    """Identity of a past-paper question across index files"""
+    paper = q.get('paper', {})
+    return (str(paper.get('year', '')), _norm(paper.get('paper', '')), _norm(q.get('questionNumber', '')))
+
+
+def merge_exam_indexes(parsed):
+    """Merge parsed index files in order, keeping the first copy of each question"""
+    all_questions = []
+    all_topics = set()
+    seen = set()
+    duplicates = 0
+
+    for data in parsed:
+        all_topics.update(data.get('topics', []))
+        for q in data['questions']:
+            key = question_key(q)
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            all_questions.append(q)
+
+    return {
+        "total_questions": len(all_questions),
+        "topics": sorted(list(all_topics)),
+        "questions": all_questions,
+        "duplicates": duplicates,
+    }
+
+
+def load_all_exam_indexes(files=None, missing=None):
+    """Parse and merge the exam index files (uncached)"""
+    if files is None:
+        files = discover_index_files(missing)
+    parsed = read_index_files(files, missing)
+    return merge_exam_indexes(parsed[f] for f in files if f in parsed)
+
+
+# -----------------------------
+# INVERTED QUESTION INDEX
+# -----------------------------
+# UI topics whose past-paper questions are also tagged with narrower topic
+# names that don't contain the UI topic as a substring.
+TOPIC_ALIASES = {
+    "Probability": ["Combinatorics", "Expected Value", "Independence", "Venn Diagrams"],
+    "Trigonometry": ["Trigonometric Equations", "Trigonometric Functions", "Sine Rule", "Cosine Rule", "Pythagoras Theorem"],
+    "Algebra": ["Quadratic Equations", "Polynomials", "Factor Theorem", "Inequalities", "Logarithms", "Simultaneous Equations", "Exponential Equations"],
+    "Geometry of the Circle": ["Circles", "Circle Geometry"],
+    "Statistics": ["Hypothesis Testing", "Confidence Intervals", "Stratified Sampling", "Normal Distribution"],
+    "Enlargements": ["Transformations"],
+    "Calculus": ["Differentiation", "Implicit Differentiation", "Integration", "Rate of Change", "Limits"],
+}
+
+
+def _norm(value):
+    return str(value).strip().lower()
+
+
+_ALIASES = {_norm(topic): aliases for topic, aliases in TOPIC_ALIASES.items()}
+
+
+class QuestionIndex:
+    """Postings of question ids by topic tag, difficulty, year and paper"""
+
+    def __init__(self, questions, postings=None, text_index=None):
+        """`postings` can supply (by_tag, by_difficulty, by_year, by_paper)
+        {normalised key: frozenset of ids} maps, and `text_index` the BM25
+        index, built elsewhere (e.g. read from a CompactIndex) instead of from
+        every question dict"""
+        self.questions = questions
+        if postings is None:
+            postings = (self._normalised(p) for p in self._postings_from_dicts(questions))
+
+        self.by_tag, self.by_difficulty, self.by_year, self.by_paper = postings
+        self._topic_cache = {}
+        self._text_index = text_index
+        self._facets = None
+        self._details = {}
+
+    @staticmethod
+    def _postings_from_dicts(questions):
+        by_tag = defaultdict(list)
+        by_difficulty = defaultdict(list)
+        by_year = defaultdict(list)
+        by_paper = defaultdict(list)
+
+        for qid, q in enumerate(questions):
+            for tag in set(q.get('topics', [])):
+                by_tag[tag].append(qid)
+            by_difficulty[q.get('difficulty', '')].append(qid)
+            paper = q.get('paper', {})
+            by_year[paper.get('year', '')].append(qid)
+            by_paper[paper.get('paper', '')].append(qid)
+
+        return by_tag, by_difficulty, by_year, by_paper
+
+    @staticmethod
+    def _normalised(postings):
+        merged = defaultdict(set)
+        for key, ids in postings.items():
+            merged[_norm(key)].update(ids)
+        return {k: frozenset(v) for k, v in merged.items()}
+
+    def topic_ids(self, topic):
+        """Ids whose topic tags contain `topic` (case-insensitive), plus its aliases"""
+        key = _norm(topic)
+        ids = self._topic_cache.get(key)
+        if ids is None:
+            # Scans the tag vocabulary, not the questions, and only once per topic
+            matched = set()
+            for tag, tag_ids in self.by_tag.items():
+                if key in tag:
+                    matched |= tag_ids
+            for alias in _ALIASES.get(key, []):
+                matched |= self.by_tag.get(_norm(alias), frozenset())
+            ids = self._topic_cache[key] = frozenset(matched)
+        return ids
+
+    def lookup(self, topic=None, difficulty=None, year=None, paper=None):
+        """Sorted ids matching every given filter"""
+        postings = []
+        if topic:
+            postings.append(self.topic_ids(topic))
+        if difficulty:
+            postings.append(self.by_difficulty.get(_norm(difficulty), frozenset()))
+        if year:
+            postings.append(self.by_year.get(_norm(year), frozenset()))
+        if paper:
+            postings.append(self.by_paper.get(_norm(paper), frozenset()))
+
+        if not postings:
+            return list(range(len(self.questions)))
+
+        postings.sort(key=len)
+        ids = postings[0].intersection(*postings[1:])
+        return sorted(ids)
+
+    @property
+    def text_index(self):
+        """BM25 index over each question's description, concepts and topics, built on first use"""
+        if self._text_index is None:
+            self._text_index = BM25Index(question_text(q) for q in self.questions)
+        return self._text_index
+
+    def nearest(self, query, topic=None, difficulty=None, k=5):
+        """Up to k questions ranked by how well they match `query`.
+
+        Questions in `topic` at `difficulty` come first, then the rest of the
+        topic; if too few share a word with the query, the topic's remaining
+        questions fill the list in file order.
+        """
+        if topic:
+            tiers = [self.topic_ids(topic)]
+            if difficulty:
+                tiers.insert(0, self._topic_level_ids(topic, difficulty))
+        else:
+            tiers = [None]
+
+        chosen = []
+        for candidates in tiers:
+            taken = set(chosen)
+            want = k - len(chosen)
+            # Scored within the tier; an earlier tier's picks are skipped, not subtracted
+            ranked = self.text_index.search(query, want + len(taken), candidates)
+            chosen += [i for i, _ in ranked if i not in taken][:want]
+            if len(chosen) < k:
+                taken.update(chosen)
+                rest = range(len(self.questions)) if candidates is None else candidates
+                chosen += heapq.nsmallest(k - len(chosen), (i for i in rest if i not in taken))
+            if len(chosen) >= k:
+                break
+        return [self.questions[i] for i in chosen]
+
+    def _topic_level_ids(self, topic, difficulty):
+        key = (_norm(topic), _norm(difficulty))
+        ids = self._topic_cache.get(key)
+        if ids is None:
+            ids = self._topic_cache[key] = self.topic_ids(topic) & self.by_difficulty.get(key[1], frozenset())
+        return ids
+
+    def search(self, query="", topic=None, difficulty=None, year=None, paper=None):
+        """Ids matching the filters, ranked by full-text match on `query`
+        (each word may be a prefix); file order when there is no query"""
+        ids = self.lookup(topic, difficulty, year, paper)
+        if not tokenize(query):
+            return ids
+        candidates = None if len(ids) == len(self.questions) else set(ids)
+        return self.text_index.prefix_search(query, candidates)
+
+    def facets(self):
+        """Distinct years (newest first) and papers, for filter menus"""
+        if self._facets is None:
+            years, papers = set(), set()
+            for q in self.questions:
+                paper = q.get('paper', {})
+                years.add(paper.get('year'))
+                papers.add(paper.get('paper'))
+            self._facets = {
+                "year": sorted((y for y in years if y), reverse=True),
+                "paper": sorted(p for p in papers if p),
+            }
+        return self._facets
+
+    def split_by_difficulty(self, ids, levels):
+        """{level: the ids at that level}, keeping the order of `ids`"""
+        postings = {level: self.by_difficulty.get(_norm(level), frozenset()) for level in levels}
+        return {level: [i for i in ids if i in postings[level]] for level in levels}
+
+    def details_markdown(self, qid):
+        """The past-paper browser's markdown for one question, built once per index load"""
+        text = self._details.get(qid)
+        if text is None:
+            q = self.questions[qid]
+            paper = q.get('paper', {})
+            text = self._details[qid] = (
+                f"**Question:** {q.get('questionNumber', 'N/A')}  \n"
+                f"**Paper:** {paper.get('year', 'N/A')} {paper.get('paper', '')}  \n"
+                f"**Topics:** {', '.join(q.get('topics', []))}  \n"
+                f"**Difficulty:** {q.get('difficulty', 'N/A')}  \n"
+                f"**Concepts:** {', '.join(q.get('concepts', []))}\n\n"
+                f"**Description:**\n\n"
+                f"> {q.get('description', 'No description available')}"
+            )
+        return text
+
+    def find(self, topic=None, difficulty=None, year=None, paper=None, limit=None):
+        """Questions matching every given filter, in file order"""
+        ids = self.lookup(topic, difficulty, year, paper)
+        if limit is not None:
+            ids = ids[:limit]
+        return [self.questions[i] for i in ids]
+
+
+class ExamIndexStore:
+    """Process-wide exam index. Only files whose mtime or size changed are
+    re-parsed; the rest keep their parsed questions from the last load."""
+
+    def __init__(self, files=None, check_interval=None, compact_path=None):
+        self._fixed_files = list(files) if files is not None else None
+        self.compact_path = COMPACT_PATH if compact_path is None else compact_path
+        self.check_interval = CHECK_INTERVAL if check_interval is None else check_interval
+        self._checked = 0.0
+        self.files = []
+        self._lock = threading.Lock()
+        self._signature = None
+        self._parsed = {}  # filename -> (stat signature, parsed data)
+        self._index = None
+        self._question_index = None
+        self.missing = []
+        self.load_seconds = 0.0
+        self.size_bytes = 0
+        self.format = None
+        self.loaded_at = None
+        self.loads = 0
+        self.files_parsed = 0
+
+    def _discover(self):
+        missing = []
+        if self._fixed_files is not None:
+            files = [f for f in self._fixed_files if os.path.exists(os.path.join(BASE_DIR, f))]
+            present = set(files)
+            missing = [f for f in self._fixed_files if f not in present]
+        else:
+            files = discover_index_files(missing)
+        return files, missing
+
+    def _file_signature(self, files):
+        signature = []
+        for filename in files + [self.compact_path]:
+            try:
+                s = os.stat(os.path.join(BASE_DIR, filename))
+                signature.append((filename, s.st_mtime_ns, s.st_size))
+            except FileNotFoundError:
+                signature.append((filename, None, None))
+        return tuple(signature)
+
+    def get(self):
+        """Return the merged EXAM_INDEX dict, reloading only if a file changed"""
+        now = time.monotonic()
+        if self._index is not None and now - self._checked < self.check_interval:
+            return self._index
+        files, missing = self._discover()
+        signature = self._file_signature(files)
+        self._checked = now
+        if signature == self._signature:
+            return self._index
+
+        with self._lock:
+            # Another session may have reloaded while we waited for the lock
+            if signature != self._signature:
+                self._load(files, missing, signature)
+            return self._index
+
+    def get_question_index(self):
+        """Return the QuestionIndex built alongside the current EXAM_INDEX"""
+        self.get()
+        return self._question_index
+
+    def _open_compact(self, files):
+        """The mmap'd compact index, if it was built from exactly the current files"""
+        if not self.compact_path or not os.path.exists(self.compact_path):
+            return None
+        try:
+            compact = CompactIndex(self.compact_path)
+        except ValueError:
+            return None
+        sources = {f: os.path.join(BASE_DIR, f) for f in files}
+        return compact if compact.is_current(sources) else None
+
+    def _parse_changed(self, files, signature):
+        """Re-parse only the files whose stat signature moved; drop vanished ones"""
+        stats = {name: (mtime, size) for name, mtime, size in signature}
+        changed = [f for f in files if self._parsed.get(f, (None,))[0] != stats[f]]
+        vanished = []
+        parsed = read_index_files(changed, vanished)
+        self._parsed = {f: entry for f, entry in self._parsed.items() if f in files and f not in vanished}
+        for filename, data in parsed.items():
+            self._parsed[filename] = (stats[filename], data)
+        self.files_parsed += len(parsed)
+        return vanished
+
+    def _load(self, files, missing, signature):
+        start = time.perf_counter()
+
+        compact = self._open_compact(files)
+        if compact is not None:
+            index = compact.as_exam_index()
+            self._question_index = QuestionIndex(index['questions'], compact.postings(), compact.text_index())
+            self.size_bytes = os.path.getsize(self.compact_path)
+            self.format = "compact"
+        else:
+            missing = missing + self._parse_changed(files, signature)
+            index = merge_exam_indexes(self._parsed[f][1] for f in files if f in self._parsed)
+            self._question_index = QuestionIndex(index['questions'])
+            self.size_bytes = sum(size for name, _, size in signature if size and name != self.compact_path)
+            self.format = "json"
+
+            # Built now so the first search or template lookup doesn't pay for it
+            self._question_index.text_index
+
+        self._index = index
+        self._signature = signature
+        self.files = [f for f in files if f not in missing]
+        self.missing = missing
+        self.load_seconds = time.perf_counter() - start
+        self.loaded_at = time.time()
+        self.loads += 1
+
+    def stats(self):
+        """Load time and size of the currently cached index"""
+        index = self._index or {}
+        return {
+            "files": len(self.files),
+            "missing": list(self.missing),
+            "total_questions": index.get("total_questions", 0),
+            "duplicates": index.get("duplicates", 0),
+            "format": self.format,
+            "size_bytes": self.size_bytes,
+            "load_ms": round(self.load_seconds * 1000, 2),
+            "loaded_at": self.loaded_at,
+            "loads": self.loads,
+            "files_parsed": self.files_parsed,
+        }
+
+
+INDEX_STORE = ExamIndexStore()
@@ -0,0 +1,173 @@
+"""Local stand-in for the Anthropic Messages API, for load tests and offline runs.
+
+    python fake_anthropic.py --port 8765 --ttft 0.8 --tokens-per-second 60
+    python fake_anthropic.py --model-speed haiku=0.4,150   # a faster model tier
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=fake streamlit run Home.py
+
+Worksheet prompts (those asking for JSON Lines) get ten JSON questions, every
+other prompt a short worked solution. Replies wait --ttft seconds before the
+first token, then stream at --tokens-per-second (one token ~ 4 characters),
+unless --model-speed gives the requested model its own pace. Replies longer
+than the request's max_tokens are cut off with stop_reason "max_tokens".
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CHARS_PER_TOKEN = 4
+
+
+def reply_text(body):
+    system = json.dumps(body.get("system", ""))
+    if "JSON Lines" in system:
+        lines = []
+        for n in range(1, 11):
+            if n % 4 == 0:
+                parts = [
+                    {"label": "a", "text": f"Find $P(X = {n})$.", "marks": 10},
+                    {"label": "b", "text": "Hence find $E(X)$.", "marks": 15},
+                ]
+                lines.append(json.dumps({"question": f"A bag holds {n} red and {n + 2} blue discs.", "parts": parts, "marks": 25, "subtopic": "Expected value"}))
+            else:
+                lines.append(json.dumps({"question": f"Solve $x^2 - {n}x - {n + 1} = 0$.", "parts": [], "marks": 10, "subtopic": "Quadratics"}))
+        return "\n".join(lines)
+    return (
+        "Step 1: Factorise: $(x - a)(x - b) = 0$.\n\n"
+        "Step 2: Set each factor to zero, so $x = a$ or $x = b$.\n\n"
+        "Step 3: Check both roots in the original equation."
+    )
+
+
+class FakeAnthropicHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    ttft = 0.0
+    tokens_per_second = 0.0  # 0 streams as fast as possible
+    model_speeds = {}  # model name substring -> (ttft, tokens_per_second)
+    requests = 0
+    _lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        with self._lock:
+            type(self).requests += 1
+        body = json.loads(self.rfile.read(int(self.headers["content-length"])))
+        text = reply_text(body)
+        stop_reason = "end_turn"
+        max_chars = int(body.get("max_tokens", 0)) * CHARS_PER_TOKEN
+        if max_chars and len(text) > max_chars:
+            text, stop_reason = text[:max_chars], "max_tokens"
+        ttft, tokens_per_second = self._speed(body.get("model", ""))
+        prompt = json.dumps(body.get("system", "")) + json.dumps(body.get("messages", []))
+        usage = {
+            "input_tokens": len(prompt) // CHARS_PER_TOKEN,
+            "output_tokens": max(1, len(text) // CHARS_PER_TOKEN),
+            "cache_read_input_tokens": 0,
+            "cache_creation_input_tokens": 0,
+        }
+        time.sleep(ttft)
+        if body.get("stream"):
+            self._stream(body, text, usage, stop_reason, tokens_per_second)
+        else:
+            time.sleep(self._generation_seconds(usage["output_tokens"], tokens_per_second))
+            message = self._message(body, usage, content=[{"type": "text", "text": text}], stop_reason=stop_reason)
+            self._send(200, "application/json", json.dumps(message).encode())
+
+    def _speed(self, model):
+        for name, speed in self.model_speeds.items():
+            if name in model:
+                return speed
+        return self.ttft, self.tokens_per_second
+
+    @staticmethod
+    def _generation_seconds(tokens, tokens_per_second):
+        return tokens / tokens_per_second if tokens_per_second > 0 else 0.0
+
+    @staticmethod
+    def _message(body, usage, content, stop_reason=None):
+        return {
+            "id": "msg_fake", "type": "message", "role": "assistant", "model": body.get("model", ""),
+            "content": content, "stop_reason": stop_reason, "stop_sequence": None, "usage": usage,
+        }
+
+    def _send(self, status, content_type, data):
+        self.send_response(status)
+        self.send_header("content-type", content_type)
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, body, text, usage, stop_reason, tokens_per_second):
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+
+        def event(name, data):
+            payload = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+            self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+            self.wfile.flush()
+
+        event("message_start", {"type": "message_start", "message": self._message(body, usage, content=[])})
+        event("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        chunk = CHARS_PER_TOKEN * 4
+        delay = self._generation_seconds(4, tokens_per_second)
+        for start in range(0, len(text), chunk):
+            time.sleep(delay)
+            delta = {"type": "text_delta", "text": text[start:start + chunk]}
+            event("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": delta})
+        event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        event("message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+            "usage": {"output_tokens": usage["output_tokens"]},
+        })
+        event("message_stop", {"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def serve(port=0, ttft=0.0, tokens_per_second=0.0, model_speeds=None):
+    """Start the stand-in on a background thread; returns the server (see .server_address)"""
+    handler = type("Handler", (FakeAnthropicHandler,), {
+        "ttft": ttft, "tokens_per_second": tokens_per_second, "model_speeds": dict(model_speeds or {}), "requests": 0,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-anthropic", daemon=True).start()
+    return server
+
+
+def parse_model_speed(value):
+    """"haiku=0.4,150" -> ("haiku", (0.4, 150.0))"""
+    name, _, speed = value.partition("=")
+    ttft, _, tokens_per_second = speed.partition(",")
+    try:
+        return name, (float(ttft), float(tokens_per_second))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected MODEL=TTFT,TOKENS_PER_SECOND, got {value!r}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.8, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="output rate; 0 = unthrottled")
+    parser.add_argument("--model-speed", type=parse_model_speed, action="append", default=[],
+                        metavar="MODEL=TTFT,TPS", help="pace for models whose name contains MODEL (repeatable)")
+    args = parser.parse_args(argv)
+
+    server = serve(args.port, args.ttft, args.tokens_per_second, dict(args.model_speed))
+    print(f"Fake Anthropic API on http://127.0.0.1:{server.server_address[1]} "
+          f"(ttft {args.ttft}s, {args.tokens_per_second} tokens/s)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import os
+import asyncio
+import threading
+
+from claude_client import make_async_client
+
+# Claude requests run as asyncio tasks on one background event loop, so an
+# in-flight generation costs a coroutine rather than a blocked thread. Callers
+# (Streamlit script threads, the worksheet pool, the API service) submit a job
+# and then stream, poll or wait on it; async callers (the API service, on its
+# own event loop) can await it instead.
+
+MAX_CONCURRENT_GENERATIONS = int(os.environ.get("MAX_CONCURRENT_GENERATIONS", 200))
+
+
+class GenerationCancelled(Exception):
+    """The job was cancelled before Claude finished"""
+
+
+class Job:
+    """Handle on one submitted generation"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._future = None
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.usage = None
+        self.stop_reason = None
+        self._waiters = []  # (loop, asyncio.Event) of each aiter_text() reader
+
+    def _notify(self):
+        self._cond.notify_all()
+        for loop, event in self._waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def _push(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._notify()
+
+    def _finish(self, error=None, usage=None, stop_reason=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self.usage = usage
+            self.stop_reason = stop_reason
+            self._notify()
+
+    def iter_text(self):
+        """Yield text chunks as they arrive; raises the job's error at the end"""
+        seen = 0
+        while True:
+            with self._cond:
+                while seen == len(self.chunks) and not self.done:
+                    self._cond.wait()
+                new = self.chunks[seen:]
+                seen = len(self.chunks)
+                finished = self.done and seen == len(self.chunks)
+            yield from new
+            if finished:
+                if self.error is not None:
+                    raise self.error
+                return
+
+    async def aiter_text(self):
+        """iter_text() for coroutines on any event loop: waits without a thread"""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            self._waiters.append(waiter)
+        try:
+            seen = 0
+            while True:
+                with self._cond:
+                    waiter[1].clear()
+                    new = self.chunks[seen:]
+                    seen = len(self.chunks)
+                    finished = self.done and seen == len(self.chunks)
+                for chunk in new:
+                    yield chunk
+                if finished:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await waiter[1].wait()
+        finally:
+            with self._cond:
+                self._waiters.remove(waiter)
+
+    def result(self):
+        return "".join(self.iter_text())
+
+    def poll(self):
+        """(text so far, done) without blocking"""
+        with self._cond:
+            return "".join(self.chunks), self.done
+
+    def cancel(self):
+        if self._future is not None and self._future.cancel():
+            # A task cancelled before it started never reaches _run's handler
+            with self._cond:
+                if not self.done:
+                    self.done = True
+                    self.error = GenerationCancelled()
+                    self._notify()
+
+
+class GenerationService:
+    """Runs Claude streams on a dedicated asyncio loop with bounded concurrency"""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_GENERATIONS):
+        self.max_concurrent = max_concurrent
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.active = 0
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="generation-loop", daemon=True).start()
+                self._client = make_async_client()
+                self._semaphore = asyncio.Semaphore(self.max_concurrent)
+                self._loop = loop
+            return self._loop
+
+    def submit(self, **params):
+        """Start a messages.stream(**params) call and return its Job immediately"""
+        loop = self._ensure_loop()
+        job = Job()
+        with self._lock:
+            self.submitted += 1
+        job._future = asyncio.run_coroutine_threadsafe(self._run(job, params), loop)
+        return job
+
+    async def _run(self, job, params):
+        try:
+            async with self._semaphore:
+                self.active += 1
+                try:
+                    async with self._client.messages.stream(**params) as stream:
+                        async for text in stream.text_stream:
+                            job._push(text)
+                        message = await stream.get_final_message()
+                finally:
+                    self.active -= 1
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            job._finish(error=GenerationCancelled())
+            raise
+        except Exception as error:
+            self.failed += 1
+            job._finish(error=error)
+        else:
+            self.completed += 1
+            job._finish(usage=message.usage, stop_reason=message.stop_reason)
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "waiting": max(0, self.submitted - self.completed - self.failed - self.cancelled - self.active),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+        }
+
+
+GENERATION_SERVICE = GenerationService()
@@ -0,0 +1,795 @@
+import os
+import contextvars
+from collections import deque
+from itertools import zip_longest
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from anthropic import APIError
+from claude_client import BREAKER, CLAUDE_TIMEOUT, CircuitOpenError, is_transient
+from generation_service import GENERATION_SERVICE
+from exam_index import INDEX_STORE, question_key
+from response_cache import RESPONSE_CACHE, fingerprint
+from worksheet_pool import WorksheetPool
+from answer_prefetch import AnswerPrefetcher
+from single_flight import SingleFlight
+from metrics import METRICS
+from model_routing import FAST_MODEL, route
+from request_scheduler import SCHEDULER, SCHEDULER_MAX_WAIT, SchedulerTimeout, estimate_tokens
+from worksheet_format import JSON_LINES_INSTRUCTIONS, QuestionParser, iter_questions, parse_questions
+
+# Everything that talks to Claude lives here rather than in Home.py, so it is
+# imported once per process (shared by all sessions and background workers)
+# and can be used outside Streamlit. The client itself is in claude_client.py.
+
+
+# -----------------------------
+# TOPICS + SUBTOPICS
+# -----------------------------
+TOPICS = ["Probability", "Trigonometry", "Algebra", "Geometry of the Circle", "Geometry of the Line", "Statistics", "Enlargements", "Calculus", "Complex Numbers"]
+
+SUBTOPICS = {
+    "Probability": [
+        "Combined events",
+        "Conditional probability",
+        "Expected value",
+        "Permutations and combinations",
+        "Binomial distribution",
+        "Bernoulli Trials",
+        "Normal Distribution"
+    ],
+    "Trigonometry": [
+        "Trigonometric identities",
+        "Graphs",
+        "Radians",
+        "Sine rule / Cosine rule",
+        "Unit Circle",
+        "Pytharagos Theorem",
+        "Angles of Elevation and Depression",
+        "Reference Angles",
+        "Trigonometric Equations",
+        "Trigonometric Functions"
+    ],
+    "Algebra": [
+        "Quadratics",
+        "Functions",
+        "Logs",
+        "Sequences & series",
+        "Inequalities",
+        "Sum and Difference of 2 Cubes",
+        "Algebraic Fractions",
+        "Simultaneous Equations in 2 Variables",
+        "Simultaneous Equations in 3 Variables",
+        "Simultaneous Equations with linear and non-linear Equations",
+        "Manipulation of Formulae",
+        "Surds"
+    ],
+    "Geometry of the Circle": [
+        "Center (0,0) and radius r",
+        "Center (h,k) and radius r",
+        "Equations of the form x^2 +y^2 + 2gx + 2gy + c = 0",
+        "Points outside, inside or on the Circle",
+        "Intersection of a Line and Circle",
+        "Equation of Tangent to a point on the Circle",
+        "Equtaion of Tangents from point outside the Circle",
+        "Touching Circles",
+        "Problems in g,f and c"
+    ],    
+    "Geometry of the Line": [
+        "Area of a Triangle",
+        "Perpendicular Distance from a point to a Line",
+        "Angle between 2 Lines"
+    ],    
+    "Calculus": [
+        "Differentiation",
+        "Integration",
+        "Rates of change",
+        "Area under curves",
+        "Product/Quotient/Chain rule"
+    ],
+    "Statistics": [
+        "Scatter Graphs",
+        "Correlation Coefficient",
+        "Mean, Mode, Median",
+        "Range , Quartiles and Interquatile Range",
+        "Standard Deviation",
+        "z-scores",
+        "Emperical Rule",
+        "Central Limit Theroem",
+        "Confidence Interval",
+        "Hypothesis Testing"
+    ],
+    "Enlargements": [
+        "Translation",
+        "Central Symmetry",
+        "Rotations",
+        "Enlargement"
+    ],
+    "Complex Numbers": [
+        "Addition and Subtraction of Complex Numbers",
+        "Multiplication of Complex Numbers",
+        "Division of Complex Numbers",
+        "Polar Form of Complex Numbers",
+        "De Moivres Theorem"
+    ],
+}
+
+# -----------------------------
+# EXAM INDEX HELPERS
+# -----------------------------
+def find_template_questions(topic, difficulty=None, subtopics=(), query="", k=5):
+    """Find the past-paper questions in the topic closest to the subtopics and
+    any extra query text (BM25), preferring the requested difficulty"""
+    question_index = INDEX_STORE.get_question_index()
+    if question_index is None:
+        return []
+
+    # The topic is already a filter; as a query term it would only score
+    # (nearly) every question in the topic and rank none of them
+    query = " ".join([*subtopics, query])
+    return question_index.nearest(query, topic, difficulty, k=k)
+
+# Past-paper questions in every prompt on a topic, whatever the request,
+# when the route's model can cache them. With the instructions they make the
+# cached system prefix, so there need to be enough of them to reach the API's
+# minimum cacheable length.
+TOPIC_REFERENCE_EXAMPLES = int(os.environ.get("TOPIC_REFERENCE_EXAMPLES", 16))
+
+_topic_reference = (None, {})  # (question index, {topic: questions})
+
+
+def topic_reference_questions(topic, k=TOPIC_REFERENCE_EXAMPLES):
+    """A fixed spread of the topic's past-paper questions, taking each
+    difficulty in turn in file order; the same for every request on the topic"""
+    global _topic_reference
+    index = INDEX_STORE.get_question_index()
+    if index is None:
+        return []
+    if _topic_reference[0] is not index:
+        _topic_reference = (index, {})
+    cached = _topic_reference[1]
+    if topic not in cached:
+        by_level = index.split_by_difficulty(index.lookup(topic), ["Easy", "Medium", "Hard"])
+        ids = [i for level in zip_longest(*by_level.values()) for i in level if i is not None]
+        cached[topic] = [index.questions[i] for i in ids[:k]]
+    return cached[topic]
+
+
+def request_examples(topic, templates, system_prompt):
+    """The closest past-paper questions for one request, formatted for the user
+    prompt, minus any already in the system prompt's topic reference set"""
+    if len(system_prompt) > 1:  # system_blocks added the reference set
+        shared = {question_key(q) for q in topic_reference_questions(topic)}
+        templates = [t for t in templates if question_key(t) not in shared]
+    return format_template_for_prompt(templates, "CLOSEST PAST-PAPER EXAMPLES FOR THIS REQUEST")
+
+
+def format_template_for_prompt(templates, heading="REAL LEAVING CERT EXAM EXAMPLES (for style reference only)"):
+    """Format template questions for inclusion in AI prompt"""
+    if not templates:
+        return ""
+    
+    formatted = f"\n\n{heading}:\n"
+    for i, t in enumerate(templates, 1):
+        formatted += f"\nExample {i}:\n"
+        formatted += f"Question: {t.get('questionNumber', 'N/A')}\n"
+        formatted += f"Topics: {', '.join(t.get('topics', []))}\n"
+        formatted += f"Difficulty: {t.get('difficulty', 'N/A')}\n"
+        formatted += f"Description: {t.get('description', 'N/A')}\n"
+        formatted += f"Year/Paper: {t.get('paper', {}).get('year', 'N/A')} {t.get('paper', {}).get('paper', '')}\n"
+    
+    formatted += "\n⚠️ DO NOT copy these questions. Use them ONLY as style references to create NEW, ORIGINAL questions.\n"
+    return formatted
+
+# -----------------------------
+# Claude CALL
+# -----------------------------
+# Max generate_answer calls in flight at once for "Solve whole worksheet"
+ANSWER_CONCURRENCY = int(os.environ.get("ANSWER_CONCURRENCY", 4))
+
+# Identical generations already in flight are shared rather than repeated
+IN_FLIGHT = SingleFlight()
+# Longest a caller waits on another's generation: its queue wait plus the request
+COALESCE_WAIT = SCHEDULER_MAX_WAIT + CLAUDE_TIMEOUT
+
+# Prompt-cache token counts per call, most recent last
+PROMPT_CACHE_USAGE = deque(maxlen=500)
+
+# Shortest prefix each model will cache, in tokens
+PROMPT_CACHE_MIN_TOKENS = {FAST_MODEL: 4096}
+DEFAULT_PROMPT_CACHE_MIN_TOKENS = 1024
+
+
+def system_blocks(instructions, prompt_route, topic=None):
+    """Build a system prompt whose prefix Anthropic can cache.
+
+    Only text identical across every request of its kind belongs here: the
+    instructions, then the topic's reference examples. Anything depending on
+    difficulty, subtopics or the question goes in the user prompt. The
+    reference examples are only added when they make a prefix the route's
+    model will cache; an uncached prefix just costs input tokens, so it gets
+    no reference set and no cache breakpoint.
+    """
+    minimum = PROMPT_CACHE_MIN_TOKENS.get(prompt_route.model, DEFAULT_PROMPT_CACHE_MIN_TOKENS)
+    blocks = [{"type": "text", "text": instructions}]
+    if topic:
+        reference = format_template_for_prompt(topic_reference_questions(topic))
+        with_reference = blocks + [{"type": "text", "text": reference}]
+        if reference and estimate_tokens(with_reference, "", 0) >= minimum:
+            blocks = with_reference
+    if estimate_tokens(blocks, "", 0) >= minimum:
+        blocks[-1]["cache_control"] = {"type": "ephemeral"}
+    return blocks
+
+
+def record_prompt_cache_usage(usage):
+    PROMPT_CACHE_USAGE.append({
+        "input_tokens": usage.input_tokens,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+        "output_tokens": usage.output_tokens,
+    })
+
+
+def prompt_cache_stats():
+    """Totals over recent calls; hit_ratio is the share of prompt tokens read from cache"""
+    totals = {"calls": len(PROMPT_CACHE_USAGE), "input_tokens": 0, "cache_read_input_tokens": 0,
+              "cache_creation_input_tokens": 0, "output_tokens": 0}
+    for usage in list(PROMPT_CACHE_USAGE):
+        for name, value in usage.items():
+            totals[name] += value
+    prompt_tokens = totals["input_tokens"] + totals["cache_read_input_tokens"] + totals["cache_creation_input_tokens"]
+    totals["hit_ratio"] = totals["cache_read_input_tokens"] / prompt_tokens if prompt_tokens else 0.0
+    return totals
+
+def call_claude(system_prompt, user_prompt, cache=True, coalesce=None, generator=None, topic=None, difficulty=None):
+    """Call Claude, serving repeat prompts from the response cache.
+
+    Pass cache=False for generators that must return something new each time.
+    coalesce (defaults to cache) lets concurrent identical calls share one request.
+    generator and difficulty pick the model (see model_routing.py); generator
+    and topic label the call in METRICS.
+    """
+    return "".join(stream_claude(system_prompt, user_prompt, cache, coalesce, generator, topic, difficulty))
+
+
+class ClaudeCall:
+    """One generation's trip through the response cache, request coalescing,
+    the circuit breaker and the rate limiter, and its accounting afterwards.
+    stream_claude drives it with start(), blocking its thread while it waits;
+    astream_claude with astart(), which awaits the same steps instead."""
+
+    def __init__(self, system_prompt, user_prompt, cache=True, coalesce=None, generator=None, topic=None, difficulty=None):
+        self.system_prompt = system_prompt
+        self.user_prompt = user_prompt
+        self.cache = cache
+        self.coalesce = cache if coalesce is None else coalesce
+        self.route = route(generator, difficulty)
+        self.timer = METRICS.timer(generator, topic, self.route.model)
+        self.key = fingerprint(self.route.model, self.route.max_tokens, system_prompt, user_prompt)
+        self.leader = False
+        self.ticket = None
+        self.job = None
+        self.chunks = []
+
+    def start(self):
+        """Everything before the first token; blocks while queued. Returns the
+        text if no request is needed (a cache hit, or an identical call in
+        flight finished it), otherwise submits one as self.job and returns None."""
+        text = self._cached()
+        if text is not None:
+            return text
+        call = self._join()
+        if call is not None:
+            text = self._shared(call.wait(COALESCE_WAIT))
+            if text is not None:
+                return text
+        try:
+            self._check_breaker()
+            try:
+                # Waits for a rate-limit slot, in turn with other sessions' requests
+                SCHEDULER.acquire(self._tokens(), self.ticket)
+            except BaseException as error:
+                self._not_admitted(error)
+                raise
+            self._submit()
+        except BaseException:
+            self._abandon()
+            raise
+        return None
+
+    async def astart(self):
+        """start() for coroutines: the coalescing and rate-limit waits are
+        awaited, so they hold no thread. If the caller is cancelled while
+        waiting, nothing is left registered or reserved."""
+        text = self._cached()
+        if text is not None:
+            return text
+        call = self._join()
+        if call is not None:
+            text = self._shared(await call.await_result(COALESCE_WAIT))
+            if text is not None:
+                return text
+        try:
+            self._check_breaker()
+            try:
+                await SCHEDULER.aacquire(self._tokens(), self.ticket)
+            except BaseException as error:
+                self._not_admitted(error)
+                raise
+            self._submit()
+        except BaseException:
+            self._abandon()
+            raise
+        return None
+
+    def _cached(self):
+        if self.cache:
+            cached = RESPONSE_CACHE.get(self.key)
+            if cached is not None:
+                self.timer.finish(cache="hit")
+                return cached
+        return None
+
+    def _join(self):
+        """Lead this prompt's generation, or return the identical call in
+        flight to wait on"""
+        self.ticket = SCHEDULER.ticket()
+        if not self.coalesce:
+            return None
+        call, self.leader = IN_FLIGHT.begin(self.key, self.ticket)
+        if self.leader:
+            return None
+        # A prefetch or batch leader still queued is moved up to our class,
+        # so an interactive request never waits at background priority
+        SCHEDULER.promote(call.ticket)
+        return call
+
+    def _shared(self, text):
+        if text is not None:
+            self.timer.finish(cache="coalesced")
+        # None: the leader failed, was abandoned or is taking too long — make our own request
+        return text
+
+    def _check_breaker(self):
+        try:
+            BREAKER.before_call()  # raises CircuitOpenError while Claude is failing
+        except CircuitOpenError:
+            self.timer.finish(outcome="rejected")
+            raise
+
+    def _tokens(self):
+        return estimate_tokens(self.system_prompt, self.user_prompt, self.route.max_tokens)
+
+    def _not_admitted(self, error):
+        """Settle a call that timed out (or was cancelled) waiting for its slot"""
+        BREAKER.release()
+        self.timer.finish(outcome="rejected" if isinstance(error, SchedulerTimeout) else "cancelled")
+
+    def _submit(self):
+        self.timer.queued(self.ticket.waited)
+        # The request itself runs on the async generation service, so waiting
+        # for it holds no connection and no extra thread
+        self.job = GENERATION_SERVICE.submit(
+            model=self.route.model,
+            max_tokens=self.route.max_tokens,
+            system=self.system_prompt,  # System prompt is separate in Claude
+            messages=[
+                {"role": "user", "content": self.user_prompt}
+            ]
+        )
+
+    def _abandon(self):
+        """No request will be made: free this prompt for identical callers"""
+        if self.leader:
+            IN_FLIGHT.finish(self.key, None)
+
+    def chunk(self, chunk):
+        self.timer.first_token()
+        self.chunks.append(chunk)
+
+    def end(self, error=None):
+        """Settle the call once self.job's stream is over: finished (no error),
+        failed, or abandoned by the reader (a BaseException such as GeneratorExit)"""
+        job, timer = self.job, self.timer
+        text = None
+        try:
+            SCHEDULER.release(self.ticket, job.usage)
+            if error is None:
+                record_prompt_cache_usage(job.usage)
+                BREAKER.record_success()
+                timer.finish(cache="miss" if self.cache else "off", usage=job.usage, stop_reason=job.stop_reason)
+                text = "".join(self.chunks)
+                # A reply cut off at the route's max_tokens is shown, but not kept
+                if self.cache and job.stop_reason != "max_tokens":
+                    RESPONSE_CACHE.put(self.key, text)
+            elif isinstance(error, Exception):
+                timer.finish(outcome="error", usage=job.usage)
+                if is_transient(error):
+                    BREAKER.record_failure()
+                else:
+                    BREAKER.release()
+            else:
+                job.cancel()  # closed mid-stream (e.g. the student clicked away)
+                timer.finish(outcome="cancelled")
+                BREAKER.release()
+        finally:
+            if self.leader:
+                IN_FLIGHT.finish(self.key, text)
+
+
+def stream_claude(system_prompt, user_prompt, cache=True, coalesce=None, generator=None, topic=None, difficulty=None):
+    """Yield Claude's response text as it arrives (a cache hit yields once)"""
+    call = ClaudeCall(system_prompt, user_prompt, cache, coalesce, generator, topic, difficulty)
+    text = call.start()
+    if text is not None:
+        yield text
+        return
+    try:
+        for chunk in call.job.iter_text():
+            call.chunk(chunk)
+            yield chunk
+    except BaseException as error:
+        call.end(error)
+        raise
+    call.end()
+
+
+async def astream_claude(system_prompt, user_prompt, cache=True, coalesce=None, generator=None, topic=None, difficulty=None):
+    """stream_claude for coroutines: holds no thread, even while queued"""
+    call = ClaudeCall(system_prompt, user_prompt, cache, coalesce, generator, topic, difficulty)
+    text = await call.astart()
+    if text is not None:
+        yield text
+        return
+    try:
+        async for chunk in call.job.aiter_text():
+            call.chunk(chunk)
+            yield chunk
+    except BaseException as error:
+        call.end(error)
+        raise
+    call.end()
+
+
+async def acall_claude(system_prompt, user_prompt, cache=True, coalesce=None, generator=None, topic=None, difficulty=None):
+    """call_claude for coroutines"""
+    return "".join([chunk async for chunk in astream_claude(system_prompt, user_prompt, cache, coalesce, generator, topic, difficulty)])
+
+
+def iter_lines(chunks):
+    """Re-chunk streamed text into complete, non-empty lines"""
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                yield line.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+
+# -----------------------------
+# LUCKY DIP HELPERS
+# -----------------------------
+def get_subtopics(topic):
+    """Return subtopics with Lucky Dip always at the top."""
+    return ["🎲 Lucky Dip"] + SUBTOPICS.get(topic, [])
+
+def resolve_subtopics(topic, subtopics):
+    """If Lucky Dip selected, return all real subtopics for this topic only."""
+    if "🎲 Lucky Dip" in subtopics:
+        return SUBTOPICS.get(topic, [])
+    return subtopics
+
+# -----------------------------
+# ENHANCED WORKSHEET GENERATORS
+# -----------------------------
+def worksheet_prompts(topic, subtopics, difficulty):
+    subtopics = resolve_subtopics(topic, subtopics)
+    chosen = ", ".join(subtopics)
+    
+    # Get template questions from exam index
+    templates = find_template_questions(topic, difficulty, subtopics)
+
+    system_prompt = system_blocks(
+        "You are a Leaving Cert Higher Level Maths tutor. "
+        "Generate exactly 10 unique exam‑style questions that match REAL Leaving Cert exam style. "
+        "Use the difficulty level and focus ONLY on the subtopics given in the request. "
+        "Use LaTeX formatting for ALL mathematical expressions. "
+        "Use ONLY inline LaTeX with single dollar signs: $ ... $. "
+        "Never use $$ ... $$ under any circumstances. "
+        "Never output plain text maths such as x^2, 1/6, sqrt(x), etc. "
+        "Every mathematical expression must be inside $ ... $. "
+        "No solutions. "
+        f"{JSON_LINES_INSTRUCTIONS}"
+        "\n"
+        "IMPORTANT: The examples below are from REAL LC papers. "
+        "Study their style, structure, and difficulty level, then create NEW questions inspired by this format.",
+        route("worksheet", difficulty),
+        topic,
+    )
+    template_context = request_examples(topic, templates, system_prompt)
+
+    user_prompt = (
+        f"Create a {difficulty} worksheet on {topic}. "
+        f"Subtopics (focus ONLY on these): {chosen}. "
+        "Generate 10 NEW questions that match the LC exam style shown in the examples. "
+        "Ensure ALL maths is in LaTeX wrapped in $ ... $."
+    ) + template_context
+
+    return system_prompt, user_prompt
+
+
+def generate_worksheet(topic, subtopics, difficulty, coalesce=True):
+    """The worksheet as a list of Question records"""
+    return list(stream_worksheet(topic, subtopics, difficulty, coalesce))
+
+
+# Easy/Medium/Hard clicks are served from here when a worksheet is ready
+# (not coalesced, or the pool could be handed the worksheet a student is streaming)
+WORKSHEET_POOL = WorksheetPool(
+    lambda topic, subtopics, difficulty: generate_worksheet(topic, subtopics, difficulty, coalesce=False)
+)
+
+
+def stream_worksheet(topic, subtopics, difficulty, coalesce=True):
+    """Yield each worksheet Question as soon as its JSON line is complete.
+
+    Never cached, but students pressing the same button at the same moment
+    share one generation unless coalesce=False.
+    """
+    system_prompt, user_prompt = worksheet_prompts(topic, subtopics, difficulty)
+    text = stream_claude(system_prompt, user_prompt, cache=False, coalesce=coalesce, generator="worksheet", topic=topic, difficulty=difficulty)
+    yield from iter_questions(iter_lines(text))
+
+
+def generate_balanced_worksheet(topic, subtopics):
+    subtopics = resolve_subtopics(topic, subtopics)
+    chosen = ", ".join(subtopics)
+    
+    # Get mixed difficulty templates
+    templates = find_template_questions(topic, subtopics=subtopics)
+
+    system_prompt = system_blocks(
+        "You are a Leaving Cert Higher Level Maths tutor. "
+        "Generate ONE exam‑style question for EACH selected subtopic. "
+        "Match the authentic LC exam style shown in the reference examples. "
+        "Use LaTeX formatting wrapped in $ ... $. "
+        "Use ONLY inline LaTeX with single dollar signs: $ ... $. "
+        "Never use $$ ... $$ under any circumstances. "
+        "Never output plain text maths such as x^2, 1/6, sqrt(x), etc. "
+        "Every mathematical expression must be inside $ ... $. "
+        f"No solutions. {JSON_LINES_INSTRUCTIONS}",
+        route("balanced_worksheet"),
+        topic,
+    )
+    template_context = request_examples(topic, templates, system_prompt)
+
+    user_prompt = f"Topic: {topic}\nSubtopics: {chosen}\n\nCreate NEW questions matching LC exam style.{template_context}"
+
+    # Fresh questions every time
+    text = call_claude(system_prompt, user_prompt, cache=False, generator="balanced_worksheet", topic=topic)
+    return parse_questions(text)
+
+
+def answer_prompts(question, topic, difficulty):
+    system_prompt = system_blocks(
+        "You are a Leaving Cert Higher Level Maths tutor. "
+        "Provide a full step‑by‑step worked solution matching LC marking scheme style. "
+        "Use LaTeX formatting wrapped in $ ... $. "
+        "Use ONLY inline LaTeX with single dollar signs: $ ... $. "
+        "Never use $$ ... $$ under any circumstances. "
+        "Never output plain text maths such as x^2, 1/6, sqrt(x), etc. "
+        "Every mathematical expression must be inside $ ... $. "
+        "Match the difficulty given in the request.",
+        route("answer", difficulty),
+    )
+
+    user_prompt = f"Topic: {topic}\nDifficulty: {difficulty}\nQuestion: {question}"
+
+    return system_prompt, user_prompt
+
+
+def generate_answer(question, topic, difficulty):
+    return call_claude(*answer_prompts(question, topic, difficulty), generator="answer", topic=topic, difficulty=difficulty)
+
+
+def stream_answer(question, topic, difficulty):
+    """Yield the worked solution as it is written"""
+    return stream_claude(*answer_prompts(question, topic, difficulty), generator="answer", topic=topic, difficulty=difficulty)
+
+
+# Answers generated ahead of "Show Answer" (opt-in, see answer_prefetch.py).
+# Same prompts as stream_answer, so a click on an answer still being
+# prefetched joins that request instead of starting another.
+ANSWER_PREFETCHER = AnswerPrefetcher(stream_answer, load=lambda: GENERATION_SERVICE.active)
+
+
+def solve_worksheet(questions, topic, difficulty, max_workers=ANSWER_CONCURRENCY):
+    """Generate answers concurrently, yielding (index, answer) as each one lands.
+    Closing the generator early drops the answers not yet started."""
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        # Each call runs in the caller's request context (session, priority)
+        futures = {
+            pool.submit(contextvars.copy_context().run, generate_answer, q, topic, difficulty): i
+            for i, q in questions
+        }
+        for future in as_completed(futures):
+            try:
+                answer = future.result()
+            except (APIError, CircuitOpenError):
+                answer = None
+            yield futures[future], answer
+    finally:
+        # Not `with`: its exit would wait for every queued call to run
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def similar_prompts(question, topic, difficulty):
+    # The past-paper questions nearest the original make the best context
+    templates = find_template_questions(topic, difficulty, query=question, k=2)
+    
+    system_prompt = system_blocks(
+        "You are a Leaving Cert Higher Level Maths tutor. "
+        "Generate ONE new question similar in style and difficulty but not identical. "
+        "Follow authentic LC exam question format. "
+        "Use LaTeX formatting wrapped in $ ... $. "
+        "Use ONLY inline LaTeX with single dollar signs: $ ... $. "
+        "Never use $$ ... $$ under any circumstances. "
+        "Never output plain text maths such as x^2, 1/6, sqrt(x), etc. "
+        "Every mathematical expression must be inside $ ... $. "
+        "No solution.",
+        route("similar", difficulty),
+        topic,
+    )
+    template_context = request_examples(topic, templates, system_prompt)  # Just 2 examples
+
+    user_prompt = f"Topic: {topic}\nOriginal question: {question}\n\nCreate a NEW similar question.{template_context}"
+
+    return system_prompt, user_prompt
+
+
+def generate_similar_question(question, topic, difficulty):
+    # Never cached — "More Like This" should give a different question every time
+    return call_claude(*similar_prompts(question, topic, difficulty), cache=False, generator="similar", topic=topic, difficulty=difficulty)
+
+
+def exam_style_prompts(topic, subtopics):
+    subtopics = resolve_subtopics(topic, subtopics)
+    chosen = ", ".join(subtopics)
+    
+    # Get exam templates
+    templates = find_template_questions(topic, subtopics=subtopics)
+
+    system_prompt = system_blocks(
+        "You are a Leaving Cert Higher Level Maths examiner. "
+        "Generate questions that EXACTLY match the style, structure, tone, and difficulty "
+        "of REAL LC Higher Level exam papers (see examples below). "
+        "Base your style on typical LC question formats, multi‑part structure, "
+        "mark‑style progression, and the level of mathematical rigor expected. "
+        "You may include multi‑part questions (a), (b), (c). "
+        "You may include diagrams described in words. "
+        "Do NOT quote or reproduce any past exam paper. "
+        "Only create new, original questions inspired by the LC style shown in examples. "
+        "Use LaTeX formatting for ALL mathematical expressions, wrapped in $ ... $. "
+        "Use ONLY inline LaTeX with single dollar signs: $ ... $. "
+        "Never use $$ ... $$ under any circumstances. "
+        "Never output plain text maths such as x^2, 1/6, sqrt(x), etc. "
+        "Every mathematical expression must be inside $ ... $. "
+        "Return exactly 3 exam‑style questions, each possibly multi‑part, no solutions. "
+        f"{JSON_LINES_INSTRUCTIONS}",
+        route("exam_style"),
+        topic,
+    )
+    template_context = request_examples(topic, templates, system_prompt)
+
+    user_prompt = (
+        f"Topic: {topic}\n"
+        f"Subtopics: {chosen}\n"
+        "Generate 3 NEW exam‑style questions matching the LC format shown in examples."
+    ) + template_context
+
+    return system_prompt, user_prompt
+
+
+def generate_exam_style_worksheet(topic, subtopics):
+    system_prompt, user_prompt = exam_style_prompts(topic, subtopics)
+    # Fresh questions every time
+    text = call_claude(system_prompt, user_prompt, cache=False, generator="exam_style", topic=topic)
+    return parse_questions(text)
+
+
+def generate_examPaper(topic, subtopics):
+    subtopics = resolve_subtopics(topic, subtopics)
+    chosen = ", ".join(subtopics)
+    
+    # Get exam templates for authentic style
+    templates = find_template_questions(topic, subtopics=subtopics)
+
+    system_prompt = system_blocks(
+        "You are a Leaving Certificate Higher Level Maths examiner. "
+        "Generate NEW, original exam‑style questions that EXACTLY match the tone, structure, "
+        "difficulty and progression of REAL LC Higher Level Maths papers (see examples below). "
+        "Follow these rules strictly: "
+        "- Match the authentic LC exam style shown in the reference examples "
+        "- Use multi‑part structure (a), (b), (c) where appropriate "
+        "- Include realistic LC‑style contexts and mathematical reasoning "
+        "- Include marks for each part, e.g. '(a) [10 marks]' "
+        "- ALL mathematical expressions must use LaTeX with $ ... $ delimiters "
+        "- Never output plain‑text maths such as x^2, 1/6, sqrt(x) "
+        "- Always use LaTeX forms such as $x^2$, $\\frac{1}{6}$, $\\sqrt{x}$ "
+        "- Never copy, quote, or paraphrase any past exam paper "
+        "- Create only NEW, original questions inspired by LC exam format "
+        "- Return EXACTLY 3 exam‑style questions "
+        "- Do NOT include solutions "
+        f"{JSON_LINES_INSTRUCTIONS}",
+        route("exam_paper"),
+        topic,
+    )
+    template_context = request_examples(topic, templates, system_prompt)
+
+    user_prompt = (
+        f"Topic: {topic}\n"
+        f"Subtopics: {chosen}\n"
+        "Generate exactly 3 Higher Level exam‑style questions matching REAL LC exam format. "
+        "Each question may contain multiple parts. "
+        "Use LaTeX with $ ... $ for all maths. "
+        "Give each part's marks in its JSON object."
+    ) + template_context
+
+    # Fresh questions every time
+    text = call_claude(system_prompt, user_prompt, cache=False, generator="exam_paper", topic=topic)
+
+    return parse_questions(text)[:3]
+
+
+# -----------------------------
+# ASYNC VARIANTS (for api.py)
+# -----------------------------
+# Same prompts, caching and accounting as the functions above, but awaiting
+# Claude instead of blocking a thread for the length of the generation.
+async def aiter_lines(chunks):
+    """iter_lines over an async stream of chunks"""
+    buffer = ""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                yield line.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+
+async def astream_worksheet(topic, subtopics, difficulty, coalesce=True):
+    system_prompt, user_prompt = worksheet_prompts(topic, subtopics, difficulty)
+    text = astream_claude(system_prompt, user_prompt, cache=False, coalesce=coalesce, generator="worksheet", topic=topic, difficulty=difficulty)
+    parser = QuestionParser()
+    async for line in aiter_lines(text):
+        for question in parser.feed(line):
+            yield question
+    for question in parser.close():
+        yield question
+
+
+async def agenerate_worksheet(topic, subtopics, difficulty):
+    return [question async for question in astream_worksheet(topic, subtopics, difficulty)]
+
+
+def astream_answer(question, topic, difficulty):
+    return astream_claude(*answer_prompts(question, topic, difficulty), generator="answer", topic=topic, difficulty=difficulty)
+
+
+async def agenerate_answer(question, topic, difficulty):
+    return await acall_claude(*answer_prompts(question, topic, difficulty), generator="answer", topic=topic, difficulty=difficulty)
+
+
+async def agenerate_similar_question(question, topic, difficulty):
+    return await acall_claude(*similar_prompts(question, topic, difficulty), cache=False, generator="similar", topic=topic, difficulty=difficulty)
+
+
+async def agenerate_exam_style_worksheet(topic, subtopics):
+    system_prompt, user_prompt = exam_style_prompts(topic, subtopics)
+    text = await acall_claude(system_prompt, user_prompt, cache=False, generator="exam_style", topic=topic)
+    return parse_questions(text)
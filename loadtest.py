@@ -0,0 +1,298 @@
+"""Load-test Home.py with simulated students against the fake Anthropic API.
+
+Each simulated session is a headless Streamlit AppTest of Home.py, all in
+this one process, like sessions sharing one web dyno. Every round, a session
+presses Easy/Medium/Hard, then Show Answer and More Like This on a random
+question. All Claude traffic goes to fake_anthropic.py.
+
+    python loadtest.py --sessions 20 --rounds 3
+    python loadtest.py --sessions 50 --ttft 1.5 --tokens-per-second 40 --json report.json
+    python loadtest.py --base-url http://127.0.0.1:8765   # an already running stand-in
+    python loadtest.py --model-speed haiku=0.3,150 [--no-routing]   # what model routing buys
+
+Reports throughput, rerun latency percentiles per action, Claude call
+latency per model, request queue waits, peak threads and memory per session.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+from fake_anthropic import serve, parse_model_speed
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+HOME = os.path.join(BASE_DIR, "Home.py")
+
+DIFFICULTY_BUTTONS = ["Easy", "Medium", "Hard"]
+# Times a step is pressed again after AppTest returns an empty render
+EMPTY_RENDER_RETRIES = 2
+
+
+def rss_bytes():
+    """Resident set size of this process (Linux; 0 where /proc is missing)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def percentile(values, p):
+    from metrics import percentile as nearest_rank
+    return nearest_rank(values, p)
+
+
+class Sampler:
+    """Polls thread count and RSS in the background, keeping the peaks"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_threads = threading.active_count()
+        self.peak_rss = rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="loadtest-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            self.peak_rss = max(self.peak_rss, rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def share_apptest_runtime():
+    """AppTest installs a mock Runtime singleton for each run and clears it
+    afterwards, which breaks sessions running side by side. Keep one shared
+    mock in place for all of them instead."""
+    from unittest.mock import MagicMock
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: shared)
+    Runtime.exists = classmethod(lambda cls: True)
+
+
+# -----------------------------
+# SIMULATED STUDENT
+# -----------------------------
+def run_session(session_id, rounds, think, timeout, timings, errors, empty, seed):
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed + session_id)
+    at = AppTest.from_file(HOME, default_timeout=timeout)
+
+    def step(action, locate=None, start=None, attempt=0):
+        """Press the widget `locate()` finds (or just load the page) and time
+        it until the page renders"""
+        widget = locate() if locate else None
+        if locate and widget is None:
+            errors.append((session_id, action, "button not rendered"))
+            return False
+        start = start or time.perf_counter()
+        try:
+            (widget.click() if widget else at).run()
+        except Exception as error:  # a timeout or a crash in the script both count
+            errors.append((session_id, action, repr(error)))
+            return False
+        if at.exception:
+            errors.append((session_id, action, at.exception[0].value))
+            return False
+        if not at.button:
+            # Every page has the difficulty buttons, so this is AppTest losing
+            # the render under concurrency. Counted apart, then the page is
+            # fetched again and the step repeated, the time spent included.
+            empty.append((session_id, action))
+            if attempt >= EMPTY_RENDER_RETRIES:
+                errors.append((session_id, action, f"empty render {attempt + 1} times"))
+                return False
+            if locate:
+                try:
+                    at.run()
+                except Exception as error:
+                    errors.append((session_id, action, repr(error)))
+                    return False
+            return step(action, locate, start, attempt + 1)
+        timings.append((action, time.perf_counter() - start))
+        if think:
+            time.sleep(rng.uniform(0, 2 * think))
+        return True
+
+    def button(key=None, label=None):
+        for b in at.button:
+            if (key is not None and b.key == key) or (label is not None and b.label == label):
+                return b
+        return None
+
+    if not step("load"):
+        return
+    for _ in range(rounds):
+        label = rng.choice(DIFFICULTY_BUTTONS)
+        if not step("worksheet", lambda: button(label=label)):
+            return
+        answers = [b for b in at.button if (b.key or "").startswith("ans_")]
+        if not answers:
+            shown = [w.value for w in list(at.warning) + list(at.error)]
+            errors.append((session_id, "worksheet", f"no questions rendered {shown}"))
+            return
+        i = rng.randrange(len(answers))
+        if not step("show_answer", lambda: button(key=f"ans_{i}")):
+            return
+        if not step("more_like_this", lambda: button(key=f"more_{i}")):
+            return
+
+
+# -----------------------------
+# REPORT
+# -----------------------------
+def summarise(timings, elapsed, sessions, sampler, rss_before, threads_before, upstream_requests):
+    by_action = {}
+    for action, seconds in timings:
+        by_action.setdefault(action, []).append(seconds)
+    everything = [s for _, s in timings]
+
+    def row(values):
+        return {
+            "count": len(values),
+            "p50_s": percentile(values, 50),
+            "p95_s": percentile(values, 95),
+            "p99_s": percentile(values, 99),
+            "max_s": max(values) if values else None,
+        }
+
+    return {
+        "sessions": sessions,
+        "elapsed_s": round(elapsed, 3),
+        "reruns": len(everything),
+        "reruns_per_s": round(len(everything) / elapsed, 2) if elapsed else None,
+        "upstream_requests": upstream_requests,
+        "all": row(everything),
+        "by_action": {action: row(values) for action, values in sorted(by_action.items())},
+        "threads_before": threads_before,
+        "peak_threads": sampler.peak_threads,
+        "rss_before_mb": round(rss_before / 2**20, 1),
+        "peak_rss_mb": round(sampler.peak_rss / 2**20, 1),
+        "rss_per_session_mb": round((sampler.peak_rss - rss_before) / 2**20 / sessions, 2),
+    }
+
+
+def print_report(report, errors):
+    print(f"\n{report['sessions']} sessions, {report['reruns']} reruns in {report['elapsed_s']}s "
+          f"({report['reruns_per_s']} reruns/s, {report['upstream_requests']} upstream requests)")
+    print(f"{'action':<16}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    rows = list(report["by_action"].items()) + [("all", report["all"])]
+    for action, r in rows:
+        cells = "".join(f"{r[k]:>9.3f}" if r[k] is not None else f"{'-':>9}" for k in ("p50_s", "p95_s", "p99_s", "max_s"))
+        print(f"{action:<16}{r['count']:>7}{cells}")
+    if report.get("empty_renders"):
+        print(f"(repeated {report['empty_renders']} steps that AppTest returned with no elements)")
+    if report.get("models"):
+        print(f"{'model':<30}{'calls':>7}{'p50':>9}{'p95':>9}{'ttft':>9}")
+        for row in report["models"]:
+            cells = "".join(f"{row[k]:>9.3f}" if row[k] is not None else f"{'-':>9}" for k in ("p50_s", "p95_s", "p50_ttft_s"))
+            print(f"{row['model']:<30}{row['calls']:>7}{cells}")
+    if report.get("scheduler"):
+        scheduler = report["scheduler"]
+        p95 = scheduler["wait_p95_s"]["interactive"]
+        print(f"request queue: {scheduler['peak_queued']} peak, interactive wait p95 "
+              f"{p95 if p95 is None else round(p95, 3)}s, {sum(scheduler['timeouts'].values())} timed out")
+    print(f"threads: {report['threads_before']} before, {report['peak_threads']} peak")
+    print(f"memory: {report['rss_before_mb']} MB before, {report['peak_rss_mb']} MB peak, "
+          f"{report['rss_per_session_mb']} MB per session")
+    if errors:
+        print(f"\n{len(errors)} errors, first few:")
+        for session_id, action, message in errors[:5]:
+            print(f"  session {session_id} {action}: {str(message)[:200]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=2, help="worksheet/answer/similar rounds per session")
+    parser.add_argument("--think", type=float, default=0.0, help="mean seconds a student pauses between clicks")
+    parser.add_argument("--ttft", type=float, default=0.5, help="fake API seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="fake API output rate; 0 = unthrottled")
+    parser.add_argument("--model-speed", type=parse_model_speed, action="append", default=[], metavar="MODEL=TTFT,TPS",
+                        help="fake API pace for models whose name contains MODEL (repeatable)")
+    parser.add_argument("--no-routing", action="store_true", help="send every call to the default model (MODEL_ROUTES={})")
+    parser.add_argument("--base-url", help="use a fake API that is already running instead of starting one")
+    parser.add_argument("--pool", action="store_true", help="leave the background worksheet pool on")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds allowed per rerun")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    upstream = None
+    if args.base_url is None:
+        upstream = serve(0, args.ttft, args.tokens_per_second, dict(args.model_speed))
+        args.base_url = f"http://127.0.0.1:{upstream.server_address[1]}"
+
+    # Must be set before the app's modules are imported (by the first session)
+    scratch = tempfile.mkdtemp(prefix="loadtest-")
+    os.environ["ANTHROPIC_BASE_URL"] = args.base_url
+    os.environ.setdefault("ANTHROPIC_API_KEY", "fake")
+    os.environ["RESPONSE_CACHE_PATH"] = os.path.join(scratch, "responses.sqlite3")
+    os.environ["QUESTION_BANK_PATH"] = os.path.join(scratch, "question_bank.sqlite3")  # empty: every worksheet is live
+    os.environ["METRICS_LOG_PATH"] = ""
+    if not args.pool:
+        os.environ["WORKSHEET_POOL_SIZE"] = "0"
+    if args.no_routing:
+        os.environ["MODEL_ROUTES"] = "{}"
+    sys.path.insert(0, BASE_DIR)
+
+    import generators  # noqa: F401  (import cost is paid once, not inside the first session's timings)
+    share_apptest_runtime()
+
+    timings, errors, empty = [], [], []
+    threads_before = threading.active_count()
+    rss_before = rss_bytes()
+    workers = [
+        threading.Thread(
+            target=run_session,
+            args=(n, args.rounds, args.think, args.timeout, timings, errors, empty, args.seed),
+            name=f"student-{n}",
+        )
+        for n in range(args.sessions)
+    ]
+
+    start = time.perf_counter()
+    with Sampler() as sampler:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    elapsed = time.perf_counter() - start
+
+    requests = upstream.RequestHandlerClass.requests if upstream else None
+    report = summarise(timings, elapsed, args.sessions, sampler, rss_before, threads_before, requests)
+    report["errors"] = len(errors)
+    report["empty_renders"] = len(empty)
+    from metrics import METRICS
+    from request_scheduler import SCHEDULER
+    report["models"] = METRICS.summary("model")
+    report["scheduler"] = SCHEDULER.stats()
+    report["settings"] = {k: v for k, v in vars(args).items() if k != "json"}
+    print_report(report, errors)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
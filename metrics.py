@@ -0,0 +1,212 @@
+import os
+import json
+import math
+import time
+import threading
+from collections import defaultdict, deque
+
+# One record per Claude call (wall time, time to first token, tokens, cost,
+# cache outcome), kept in a rolling in-memory window for the admin panel,
+# appended to a rolling JSON Lines log, and summed into counters exported in
+# Prometheus text format by the API service's /metrics.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+METRICS_WINDOW = int(os.environ.get("METRICS_WINDOW", 5000))  # calls kept in memory
+# Set METRICS_LOG_PATH="" to disable the log
+METRICS_LOG_PATH = os.environ.get("METRICS_LOG_PATH", os.path.join(BASE_DIR, ".cache", "claude_calls.jsonl"))
+METRICS_LOG_MAX_BYTES = int(os.environ.get("METRICS_LOG_MAX_BYTES", 10 * 1024 * 1024))  # then rotated to .1
+
+# USD per million tokens: (input, output). Cache reads bill at 10% of the
+# input price and cache writes at 125%.
+MODEL_PRICES = {
+    "claude-sonnet-4-6": (3.00, 15.00),
+    "claude-opus-4-6": (5.00, 25.00),
+    "claude-haiku-4-5-20251001": (1.00, 5.00),
+    "claude-haiku-4-5": (1.00, 5.00),
+}
+CACHE_READ_PRICE = 0.10
+CACHE_WRITE_PRICE = 1.25
+
+# Prometheus histogram buckets for wall time, in seconds
+LATENCY_BUCKETS = (0.05, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120)
+
+
+def call_cost(model, input_tokens=0, output_tokens=0, cache_read_tokens=0, cache_write_tokens=0):
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (
+        input_tokens * input_price
+        + cache_read_tokens * input_price * CACHE_READ_PRICE
+        + cache_write_tokens * input_price * CACHE_WRITE_PRICE
+        + output_tokens * output_price
+    ) / 1_000_000
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an unsorted list (None if empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class CallTimer:
+    """Times one call; finish() records it (only the first finish counts)"""
+
+    def __init__(self, metrics, generator, topic, model):
+        self.metrics = metrics
+        self.generator = generator
+        self.topic = topic
+        self.model = model
+        self.start = time.perf_counter()
+        self.ttft = None
+        self.queue_s = None
+        self.finished = False
+
+    def queued(self, seconds):
+        """Time spent waiting in the request scheduler (part of wall time)"""
+        self.queue_s = seconds
+
+    def first_token(self):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start
+
+    def finish(self, cache="miss", outcome="ok", usage=None, stop_reason=None):
+        if self.finished:
+            return
+        self.finished = True
+        wall = time.perf_counter() - self.start
+        tokens = {
+            "input_tokens": getattr(usage, "input_tokens", None) or 0,
+            "output_tokens": getattr(usage, "output_tokens", None) or 0,
+            "cache_read_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+            "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+        }
+        self.metrics.record({
+            "ts": time.time(),
+            "generator": self.generator,
+            "topic": self.topic,
+            "model": self.model,
+            "cache": cache,
+            "outcome": outcome,
+            "stop_reason": stop_reason,
+            "wall_s": round(wall, 4),
+            "ttft_s": round(self.ttft if self.ttft is not None else wall, 4),
+            "queue_s": round(self.queue_s, 4) if self.queue_s is not None else None,
+            **tokens,
+            "cost_usd": call_cost(self.model, **tokens),
+        })
+
+
+class Metrics:
+    """Rolling window of call records plus cumulative Prometheus counters"""
+
+    def __init__(self, window=METRICS_WINDOW, log_path=METRICS_LOG_PATH, log_max_bytes=METRICS_LOG_MAX_BYTES):
+        self.records = deque(maxlen=window)
+        self.log_path = log_path
+        self.log_max_bytes = log_max_bytes
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._counters = defaultdict(float)  # (name, labels) -> value
+        self._buckets = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+        self._latency_sum = defaultdict(float)
+
+    def timer(self, generator, topic=None, model=None):
+        return CallTimer(self, generator or "unknown", topic, model)
+
+    def record(self, record):
+        labels = (("generator", record["generator"]), ("model", record["model"] or ""))
+        with self._lock:
+            self.records.append(record)
+            self._counters[("claude_calls_total", labels + (("cache", record["cache"]), ("outcome", record["outcome"])))] += 1
+            for kind in ("input", "output", "cache_read", "cache_write"):
+                self._counters[("claude_tokens_total", labels + (("kind", kind),))] += record[f"{kind}_tokens"]
+            self._counters[("claude_cost_usd_total", labels)] += record["cost_usd"]
+            if record["cache"] in ("miss", "off") and record["outcome"] == "ok":
+                buckets = self._buckets[labels]
+                for i, bound in enumerate(LATENCY_BUCKETS):
+                    if record["wall_s"] <= bound:
+                        buckets[i] += 1
+                buckets[-1] += 1
+                self._latency_sum[labels] += record["wall_s"]
+        self._log(record)
+
+    def _log(self, record):
+        if not self.log_path:
+            return
+        line = json.dumps(record) + "\n"
+        with self._log_lock:
+            try:
+                os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+                if os.path.exists(self.log_path) and os.path.getsize(self.log_path) + len(line) > self.log_max_bytes:
+                    os.replace(self.log_path, self.log_path + ".1")
+                with open(self.log_path, "a") as f:
+                    f.write(line)
+            except OSError:
+                pass  # metrics must never break a generation
+
+    def summary(self, by="topic"):
+        """Per-group latency percentiles, tokens, cache hits and spend over the window"""
+        groups = defaultdict(list)
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            groups[record.get(by) or "—"].append(record)
+
+        rows = []
+        for name, group in sorted(groups.items()):
+            # Latency of real API calls; cache hits would drag the percentiles down
+            live = [r for r in group if r["cache"] in ("miss", "off") and r["outcome"] == "ok"]
+            wall = [r["wall_s"] for r in live]
+            ttft = [r["ttft_s"] for r in live]
+            queued = [r["queue_s"] for r in live if r.get("queue_s") is not None]
+            hits = sum(r["cache"] in ("hit", "coalesced") for r in group)
+            rows.append({
+                by: name,
+                "calls": len(group),
+                "errors": sum(r["outcome"] != "ok" for r in group),
+                "truncated": sum(r.get("stop_reason") == "max_tokens" for r in group),
+                "cache_hit_rate": round(hits / len(group), 3),
+                "p50_s": percentile(wall, 50),
+                "p95_s": percentile(wall, 95),
+                "p50_ttft_s": percentile(ttft, 50),
+                "p95_queue_s": percentile(queued, 95),
+                "input_tokens": sum(r["input_tokens"] + r["cache_read_tokens"] + r["cache_write_tokens"] for r in group),
+                "output_tokens": sum(r["output_tokens"] for r in group),
+                "spend_usd": round(sum(r["cost_usd"] for r in group), 4),
+            })
+        return rows
+
+    def prometheus(self):
+        """Cumulative counters and latency histograms in Prometheus text format"""
+        def fmt(labels):
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((labels, list(b), self._latency_sum[labels]) for labels, b in self._buckets.items())
+
+        helps = {
+            "claude_calls_total": "Claude calls by generator, cache outcome and result",
+            "claude_tokens_total": "Tokens billed by Claude calls",
+            "claude_cost_usd_total": "Estimated spend on Claude calls in USD",
+        }
+        for name, help_text in helps.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{n}{fmt(labels)} {value:g}" for (n, labels), value in counters if n == name)
+
+        lines.append("# HELP claude_call_seconds Wall time of uncached Claude calls")
+        lines.append("# TYPE claude_call_seconds histogram")
+        for labels, buckets, total in histograms:
+            for bound, count in zip(LATENCY_BUCKETS, buckets):
+                lines.append(f"claude_call_seconds_bucket{fmt(labels + (('le', f'{bound:g}'),))} {count}")
+            lines.append(f"claude_call_seconds_bucket{fmt(labels + (('le', '+Inf'),))} {buckets[-1]}")
+            lines.append(f"claude_call_seconds_sum{fmt(labels)} {total:g}")
+            lines.append(f"claude_call_seconds_count{fmt(labels)} {buckets[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
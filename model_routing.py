@@ -0,0 +1,56 @@
+import os
+import json
+from dataclasses import dataclass
+
+# Which model and output budget each generator uses, optionally per
+# difficulty. Short or easy generations go to a smaller, faster model; exam
+# papers and the harder worked solutions stay on the larger one.
+#
+# Routes are looked up as "generator:difficulty", then "generator", then "*".
+# MODEL_ROUTES (JSON, same shape as DEFAULT_ROUTES) replaces the table, e.g.
+#   MODEL_ROUTES='{"*": {"model": "claude-sonnet-4-6", "max_tokens": 4096}}'
+# sends everything to one model, as before routing existed.
+
+CLAUDE_MODEL = "claude-sonnet-4-6"  # Claude Sonnet 4.6
+FAST_MODEL = "claude-haiku-4-5-20251001"  # Claude Haiku 4.5
+DEFAULT_MAX_TOKENS = 4096
+
+
+@dataclass(frozen=True)
+class Route:
+    model: str
+    max_tokens: int = DEFAULT_MAX_TOKENS
+
+
+DEFAULT_ROUTES = {
+    "*": Route(CLAUDE_MODEL),
+    # One question, a few sentences long
+    "similar": Route(FAST_MODEL, 1024),
+    "worksheet:Easy": Route(FAST_MODEL, 2048),
+    "answer:Easy": Route(FAST_MODEL, 2048),
+}
+
+
+def load_routes(config=None):
+    """The routing table from a MODEL_ROUTES-style JSON string (defaults if empty)"""
+    if not config:
+        return dict(DEFAULT_ROUTES)
+    routes = {}
+    for key, value in json.loads(config).items():
+        if isinstance(value, str):
+            value = {"model": value}
+        routes[key] = Route(value["model"], int(value.get("max_tokens", DEFAULT_MAX_TOKENS)))
+    routes.setdefault("*", Route(CLAUDE_MODEL))
+    return routes
+
+
+ROUTES = load_routes(os.environ.get("MODEL_ROUTES"))
+
+
+def route(generator=None, difficulty=None, routes=None):
+    """The Route for one call"""
+    routes = ROUTES if routes is None else routes
+    for key in (f"{generator}:{difficulty}", generator, "*"):
+        if key in routes:
+            return routes[key]
+    return Route(CLAUDE_MODEL)
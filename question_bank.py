@@ -0,0 +1,133 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+
+# Local bank of pre-generated questions (filled offline by batch_generate.py),
+# so worksheets can be served without any API call.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_PATH = os.environ.get("QUESTION_BANK_PATH", os.path.join(BASE_DIR, "question_bank.sqlite3"))
+
+# Subtopic recorded for questions generated across a topic's whole subtopic list
+ALL_SUBTOPICS = ""
+
+_NUMBERING = re.compile(r"^\s*(?:\*\*)?(?:Question\s+)?\d+[.):]\s*(?:\*\*)?\s*", re.IGNORECASE)
+
+
+def strip_numbering(line):
+    """'3. Solve $x^2 = 4$' -> 'Solve $x^2 = 4$' (the app numbers questions itself)"""
+    return _NUMBERING.sub("", line, count=1).strip()
+
+
+class QuestionBank:
+    """SQLite question bank indexed on (topic, difficulty, subtopic)"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self, create=False):
+        # Opened lazily so the app doesn't create an empty bank file on startup
+        if self._conn is None:
+            if not create and not os.path.exists(self.path):
+                return None
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                " id INTEGER PRIMARY KEY,"
+                " topic TEXT NOT NULL,"
+                " subtopic TEXT NOT NULL,"
+                " difficulty TEXT NOT NULL,"
+                " text TEXT NOT NULL,"
+                " batch_id TEXT,"
+                " created REAL NOT NULL,"
+                " UNIQUE (topic, subtopic, difficulty, text));"
+                "CREATE INDEX IF NOT EXISTS questions_lookup ON questions (topic, difficulty, subtopic);"
+                "CREATE TABLE IF NOT EXISTS batch_requests ("
+                " custom_id TEXT NOT NULL,"
+                " batch_id TEXT NOT NULL,"
+                " topic TEXT NOT NULL,"
+                " subtopic TEXT NOT NULL,"
+                " difficulty TEXT NOT NULL,"
+                " PRIMARY KEY (batch_id, custom_id));"
+            )
+        return self._conn
+
+    def add_questions(self, topic, subtopic, difficulty, questions, batch_id=None):
+        """Store parsed questions, skipping exact duplicates. Returns how many were new."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect(create=True)
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO questions (topic, subtopic, difficulty, text, batch_id, created)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [(topic, subtopic, difficulty, q, batch_id, now) for q in questions],
+            )
+            conn.commit()
+            return conn.total_changes - before
+
+    def record_requests(self, batch_id, requests):
+        """Remember what each custom_id in a batch was for, so results can be filed later"""
+        with self._lock:
+            conn = self._connect(create=True)
+            conn.executemany(
+                "INSERT OR REPLACE INTO batch_requests (custom_id, batch_id, topic, subtopic, difficulty)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(custom_id, batch_id, *meta) for custom_id, meta in requests.items()],
+            )
+            conn.commit()
+
+    def batch_requests(self, batch_id):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return {}
+            rows = conn.execute(
+                "SELECT custom_id, topic, subtopic, difficulty FROM batch_requests WHERE batch_id = ?",
+                (batch_id,),
+            ).fetchall()
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+    def draw(self, topic, subtopics, difficulty, n=10, all_subtopics=False):
+        """Random sample of n stored questions (JSON records, see worksheet_format.py),
+        or [] if the bank can't fill a worksheet"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return []
+            # SQLite picks the sample, so only n rows ever leave the database
+            if all_subtopics:
+                rows = conn.execute(
+                    "SELECT text FROM questions WHERE topic = ? AND difficulty = ?"
+                    " ORDER BY RANDOM() LIMIT ?",
+                    (topic, difficulty, n),
+                ).fetchall()
+            else:
+                placeholders = ", ".join("?" for _ in subtopics)
+                rows = conn.execute(
+                    "SELECT text FROM questions WHERE topic = ? AND difficulty = ?"
+                    f" AND subtopic IN ({placeholders}) ORDER BY RANDOM() LIMIT ?",
+                    (topic, difficulty, *subtopics, n),
+                ).fetchall()
+
+        if len(rows) < n:
+            return []
+        return [row[0] for row in rows]
+
+    def stats(self):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return {"questions": 0, "topics": 0}
+            questions, topics = conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT topic) FROM questions"
+            ).fetchone()
+        return {"questions": questions, "topics": topics}
+
+
+QUESTION_BANK = QuestionBank()
@@ -0,0 +1,301 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict, deque
+
+from claude_client import CircuitOpenError
+from metrics import percentile
+
+# Every Claude request waits here for a slot before it is sent. Token buckets
+# keep the process under the API tier's requests- and tokens-per-minute, so a
+# burst queues here instead of coming back as 429s. Waiting requests go out
+# by priority class (interactive, then prefetch, then batch) and, within a
+# class, round-robin across sessions, so one student clicking "More Like
+# This" over and over only delays their own requests.
+
+# Set to your API tier's limits (0 = no limit). Every process sending Claude
+# requests has its own scheduler, so each one keeps to an equal share: set
+# CLAUDE_PROCESSES to how many there are across all dynos. The default is the
+# Procfile's: one Streamlit process plus the API's default two workers.
+CLAUDE_RPM = float(os.environ.get("CLAUDE_RPM", 1000))
+CLAUDE_TPM = float(os.environ.get("CLAUDE_TPM", 450000))  # input + output tokens
+CLAUDE_PROCESSES = max(1, int(os.environ.get("CLAUDE_PROCESSES", 3)))
+SCHEDULER_MAX_WAIT = float(os.environ.get("SCHEDULER_MAX_WAIT", 30))  # seconds before giving up
+SCHEDULER_WINDOW = 1000  # recent waits kept per class, for percentiles
+
+CHARS_PER_TOKEN = 4  # rough prompt size estimate before the API counts it
+
+INTERACTIVE = "interactive"
+PREFETCH = "prefetch"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, PREFETCH, BATCH)  # highest first
+
+# (session id, priority class) of the code making Claude calls in this thread
+_REQUEST_CONTEXT = contextvars.ContextVar("claude_request_context", default=(None, INTERACTIVE))
+
+
+def set_request_context(session=None, priority=INTERACTIVE):
+    """Label this thread's Claude calls with a session and priority class"""
+    _REQUEST_CONTEXT.set((session, priority))
+
+
+def estimate_tokens(system_prompt, user_prompt, max_tokens):
+    """Tokens to reserve for a request: its prompt, plus its whole output budget
+    (the unused part is handed back when the reply's real usage is known)"""
+    if not isinstance(system_prompt, str):
+        system_prompt = " ".join(block.get("text", "") for block in system_prompt)
+    return (len(system_prompt) + len(user_prompt)) // CHARS_PER_TOKEN + max_tokens
+
+
+def used_tokens(usage):
+    """Tokens a finished reply counted against the limit (cache reads don't)"""
+    if usage is None:
+        return None
+    return (usage.input_tokens + (getattr(usage, "cache_creation_input_tokens", None) or 0)
+            + usage.output_tokens)
+
+
+class SchedulerTimeout(CircuitOpenError):
+    """A request waited longer than SCHEDULER_MAX_WAIT for a rate-limit slot.
+    A CircuitOpenError, so callers show the same "busy, try again" message."""
+
+
+class TokenBucket:
+    """`rate` units per minute, refilled continuously, holding at most a minute's worth"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = rate
+        self.level = rate
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate / 60)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken (0 if it can be now)"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)  # anything bigger would wait forever
+        return max(0.0, (amount - self.level) * 60 / self.rate)
+
+    def take(self, amount):
+        if self.rate > 0:
+            self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        """Return an over-estimate (or, if negative, charge an under-estimate)"""
+        if self.rate > 0:
+            self.level = max(-self.capacity, min(self.capacity, self.level + amount))
+
+
+class Ticket:
+    def __init__(self, session, priority, tokens=0):
+        self.session = session
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.queued = False
+        self.waited = None
+
+
+class RequestScheduler:
+    """Rate-limited, fair, prioritised admission of Claude requests"""
+
+    def __init__(self, rpm=CLAUDE_RPM / CLAUDE_PROCESSES, tpm=CLAUDE_TPM / CLAUDE_PROCESSES,
+                 max_wait=SCHEDULER_MAX_WAIT):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        # priority -> session -> deque of waiting tickets, sessions in turn order
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._waits = {priority: deque(maxlen=SCHEDULER_WINDOW) for priority in PRIORITIES}
+        self.admitted = {priority: 0 for priority in PRIORITIES}
+        self.timeouts = {priority: 0 for priority in PRIORITIES}
+        self.peak_depth = 0
+        self._waiters = []  # (loop, asyncio.Event) of each aacquire() caller
+
+    def _notify(self):
+        self._cond.notify_all()
+        for loop, event in self._waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def _head(self):
+        for priority in PRIORITIES:
+            for tickets in self._queues[priority].values():
+                return tickets[0]
+        return None
+
+    def _depth(self):
+        return sum(len(t) for q in self._queues.values() for t in q.values())
+
+    def _remove(self, ticket):
+        ticket.queued = False
+        sessions = self._queues[ticket.priority]
+        tickets = sessions[ticket.session]
+        if tickets[0] is ticket:
+            tickets.popleft()
+            # This session has had its turn; others in the class go first
+            del sessions[ticket.session]
+            if tickets:
+                sessions[ticket.session] = tickets
+        else:
+            tickets.remove(ticket)
+            if not tickets:
+                del sessions[ticket.session]
+
+    def ticket(self):
+        """A Ticket in this thread's request context. Made before acquire() when
+        someone else may need to promote() the request while it waits."""
+        session, priority = _REQUEST_CONTEXT.get()
+        return Ticket(session, priority)
+
+    def acquire(self, tokens, ticket=None):
+        """Block until a request of about `tokens` tokens may be sent, in this
+        thread's request context (or `ticket`'s); returns the Ticket for release()"""
+        ticket = ticket or self.ticket()
+        with self._cond:
+            deadline = self._start_wait(ticket, tokens)
+            while True:
+                wait = self._admit(ticket, deadline)
+                if wait is None:
+                    return ticket
+                self._cond.wait(wait)
+
+    async def aacquire(self, tokens, ticket=None):
+        """acquire() for coroutines on any event loop: waits without a thread.
+        A cancelled caller's ticket leaves the queue."""
+        ticket = ticket or self.ticket()
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            deadline = self._start_wait(ticket, tokens)
+            self._waiters.append(waiter)
+        try:
+            while True:
+                with self._cond:
+                    waiter[1].clear()
+                    wait = self._admit(ticket, deadline)
+                if wait is None:
+                    return ticket
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._cond:
+                if ticket.queued:
+                    self._remove(ticket)
+                    self._notify()
+            raise
+        finally:
+            with self._cond:
+                self._waiters.remove(waiter)
+
+    def _start_wait(self, ticket, tokens):
+        """Queue `ticket` for `tokens` tokens (holding the lock); returns its deadline"""
+        ticket.tokens = tokens
+        ticket.enqueued = time.monotonic()
+        self._enqueue(ticket)
+        self.peak_depth = max(self.peak_depth, self._depth())
+        return ticket.enqueued + self.max_wait
+
+    def _admit(self, ticket, deadline):
+        """Admit `ticket` if it is its turn and the buckets allow (holding the
+        lock). Returns None once admitted, otherwise seconds to wait before
+        trying again; raises SchedulerTimeout past the deadline."""
+        now = time.monotonic()
+        wait = None
+        if self._head() is ticket:
+            wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(ticket.tokens, now))
+            if wait == 0:
+                self.requests.take(1)
+                self.tokens.take(ticket.tokens)
+                self._remove(ticket)
+                ticket.waited = now - ticket.enqueued
+                self._waits[ticket.priority].append(ticket.waited)
+                self.admitted[ticket.priority] += 1
+                self._notify()
+                return None
+        if now >= deadline:
+            self._remove(ticket)
+            self.timeouts[ticket.priority] += 1
+            self._notify()
+            raise SchedulerTimeout(f"Too many requests queued; gave up after {self.max_wait:.0f}s")
+        return min(wait, deadline - now) if wait is not None else deadline - now
+
+    def _enqueue(self, ticket):
+        self._queues[ticket.priority].setdefault(ticket.session, deque()).append(ticket)
+        ticket.queued = True
+
+    def promote(self, ticket, priority=None):
+        """Raise a request not yet sent to `priority` (by default this thread's
+        class), e.g. when an interactive request is waiting on its result"""
+        if priority is None:
+            priority = _REQUEST_CONTEXT.get()[1]
+        with self._cond:
+            if ticket.waited is not None or PRIORITIES.index(priority) >= PRIORITIES.index(ticket.priority):
+                return
+            if ticket.queued:
+                self._remove(ticket)
+                ticket.priority = priority
+                self._enqueue(ticket)
+                self._notify()
+            else:
+                ticket.priority = priority  # not queued yet; acquire() will use it
+
+    def release(self, ticket, usage=None):
+        """Settle the token reservation once the reply's usage is known
+        (without usage, e.g. after an error, the whole estimate stays spent)"""
+        used = used_tokens(usage)
+        if used is None:
+            return
+        with self._cond:
+            self.tokens.give_back(ticket.tokens - used)
+            self._notify()
+
+    def stats(self):
+        with self._cond:
+            depth = {p: sum(len(t) for t in self._queues[p].values()) for p in PRIORITIES}
+            waits = {p: list(self._waits[p]) for p in PRIORITIES}
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            return {
+                "rpm": round(self.requests.rate, 1) or None,  # this process's share
+                "tpm": round(self.tokens.rate) or None,
+                "queued": depth,
+                "peak_queued": self.peak_depth,
+                "admitted": dict(self.admitted),
+                "timeouts": dict(self.timeouts),
+                "wait_p50_s": {p: percentile(w, 50) for p, w in waits.items()},
+                "wait_p95_s": {p: percentile(w, 95) for p, w in waits.items()},
+                "requests_available": round(self.requests.level, 1) if self.requests.rate > 0 else None,
+                "tokens_available": round(self.tokens.level) if self.tokens.rate > 0 else None,
+            }
+
+    def prometheus(self):
+        """Queue gauges and admission counters in Prometheus text format"""
+        stats = self.stats()
+        lines = [
+            "# HELP claude_queue_depth Claude requests waiting for a rate-limit slot",
+            "# TYPE claude_queue_depth gauge",
+        ]
+        lines += [f'claude_queue_depth{{priority="{p}"}} {n}' for p, n in stats["queued"].items()]
+        lines += ["# HELP claude_queue_admitted_total Claude requests let through", "# TYPE claude_queue_admitted_total counter"]
+        lines += [f'claude_queue_admitted_total{{priority="{p}"}} {n}' for p, n in stats["admitted"].items()]
+        lines += ["# HELP claude_queue_timeouts_total Claude requests that gave up waiting", "# TYPE claude_queue_timeouts_total counter"]
+        lines += [f'claude_queue_timeouts_total{{priority="{p}"}} {n}' for p, n in stats["timeouts"].items()]
+        lines += ["# HELP claude_queue_wait_seconds Recent queue waits", "# TYPE claude_queue_wait_seconds summary"]
+        for p in PRIORITIES:
+            for q, key in (("0.5", "wait_p50_s"), ("0.95", "wait_p95_s")):
+                if stats[key][p] is not None:
+                    lines.append(f'claude_queue_wait_seconds{{priority="{p}",quantile="{q}"}} {stats[key][p]:g}')
+        return "\n".join(lines) + "\n"
+
+
+SCHEDULER = RequestScheduler()
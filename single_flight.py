@@ -0,0 +1,77 @@
+import asyncio
+import threading
+
+# Request coalescing: while a generation for a given prompt fingerprint is in
+# flight, identical requests wait for it and share its result instead of
+# making their own API call.
+
+
+class _Call:
+    def __init__(self, ticket=None):
+        self._lock = threading.Lock()
+        self.done = threading.Event()
+        self.result = None
+        self.ticket = ticket  # the leader's scheduler ticket, for followers to promote
+        self._waiters = []  # (loop, asyncio.Event) of each await_result() caller
+
+    def _publish(self, result):
+        with self._lock:
+            self.result = result
+            self.done.set()
+            for loop, event in self._waiters:
+                loop.call_soon_threadsafe(event.set)
+
+    def wait(self, timeout=None):
+        """Block until the leader finishes; None if it failed or was abandoned"""
+        self.done.wait(timeout)
+        return self.result
+
+    async def await_result(self, timeout=None):
+        """wait() for coroutines on any event loop: waits without a thread"""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            if self.done.is_set():
+                return self.result
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.remove(waiter)
+        return self.result
+
+
+class SingleFlight:
+    """Tracks in-flight calls by key and counts how many callers were coalesced"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def begin(self, key, ticket=None):
+        """Return (call, is_leader). The leader must call finish(key, ...) when done;
+        `ticket` is kept on the call if this caller becomes the leader."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = self._calls[key] = _Call(ticket)
+            self.leaders += 1
+            return call, True
+
+    def finish(self, key, result=None):
+        """Publish the leader's result (None on failure, so waiters retry themselves)"""
+        with self._lock:
+            call = self._calls.pop(key, None)
+        if call is not None:
+            call._publish(result)
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        return {"in_flight": in_flight, "leaders": self.leaders, "coalesced": self.coalesced}
@@ -0,0 +1,118 @@
+import os
+import sys
+import asyncio
+import threading
+
+import pytest
+from anthropic.types import Usage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("METRICS_LOG_PATH", "")
+os.environ.setdefault("WORKSHEET_POOL_SIZE", "0")
+
+import generators
+from claude_client import CircuitBreaker, CircuitOpenError
+from generation_service import Job
+from request_scheduler import INTERACTIVE, RequestScheduler
+from single_flight import SingleFlight
+
+
+class FinishedService:
+    """Stands in for GENERATION_SERVICE: each submit returns a finished Job"""
+
+    def __init__(self, chunks=("Answer",), error=None):
+        self.chunks = chunks
+        self.error = error
+        self.submitted = 0
+
+    def submit(self, **params):
+        self.submitted += 1
+        job = Job()
+        for chunk in self.chunks:
+            job._push(chunk)
+        job._finish(error=self.error, usage=None if self.error else Usage(input_tokens=10, output_tokens=5))
+        return job
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    scheduler = RequestScheduler(rpm=6, tpm=0)
+    monkeypatch.setattr(generators, "SCHEDULER", scheduler)
+    monkeypatch.setattr(generators, "IN_FLIGHT", SingleFlight())
+    monkeypatch.setattr(generators, "BREAKER", CircuitBreaker())
+    return scheduler
+
+
+def stream_answer():
+    return generators.stream_claude("System.", "Question?", cache=False, coalesce=True, generator="answer")
+
+
+def answer_call():
+    return generators.ClaudeCall("System.", "Question?", cache=False, coalesce=True, generator="answer")
+
+
+def test_cancelled_while_queued_frees_the_prompt(scheduler):
+    scheduler.requests.level = 0  # the next request has to queue
+
+    async def cancel_while_queued():
+        task = asyncio.create_task(answer_call().astart())
+        await asyncio.sleep(0.05)
+        assert scheduler.stats()["queued"][INTERACTIVE] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_while_queued())
+    assert scheduler.stats()["queued"][INTERACTIVE] == 0
+    assert generators.IN_FLIGHT.stats()["in_flight"] == 0
+    # The next identical call leads its own request instead of waiting
+    call = answer_call()
+    assert call._join() is None and call.leader
+
+
+def test_follower_awaits_the_leaders_result_without_a_thread(scheduler):
+    call = answer_call()
+    generators.IN_FLIGHT.begin(call.key, scheduler.ticket())
+    threading.Timer(0.05, generators.IN_FLIGHT.finish, (call.key, "shared")).start()
+    threads = threading.active_count()
+
+    async def follow():
+        return await call.astart()
+
+    assert asyncio.run(follow()) == "shared"
+    assert threading.active_count() <= threads
+
+
+def test_follower_makes_its_own_request_when_the_leader_fails(scheduler, monkeypatch):
+    service = FinishedService()
+    monkeypatch.setattr(generators, "GENERATION_SERVICE", service)
+    call = answer_call()
+    generators.IN_FLIGHT.begin(call.key, scheduler.ticket())
+    threading.Timer(0.05, generators.IN_FLIGHT.finish, (call.key, None)).start()
+    assert call.start() is None and not call.leader
+    assert service.submitted == 1 and call.job.result() == "Answer"
+    assert generators.IN_FLIGHT.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 1}
+
+
+def test_key_is_freed_when_the_leaders_request_fails(scheduler, monkeypatch):
+    monkeypatch.setattr(generators, "GENERATION_SERVICE", FinishedService(error=ValueError("bad reply")))
+    with pytest.raises(ValueError):
+        "".join(stream_answer())
+    assert generators.IN_FLIGHT.stats()["in_flight"] == 0
+
+
+def test_key_is_freed_when_the_leader_is_rejected(scheduler, monkeypatch):
+    breaker = CircuitBreaker(threshold=1)
+    breaker.record_failure()
+    monkeypatch.setattr(generators, "BREAKER", breaker)
+    with pytest.raises(CircuitOpenError):
+        answer_call().start()
+    assert generators.IN_FLIGHT.stats()["in_flight"] == 0
+
+
+def test_key_is_freed_when_the_leaders_reader_stops(scheduler, monkeypatch):
+    monkeypatch.setattr(generators, "GENERATION_SERVICE", FinishedService(chunks=("One", "Two")))
+    stream = stream_answer()
+    assert next(stream) == "One"
+    stream.close()  # the student clicked away
+    assert generators.IN_FLIGHT.stats()["in_flight"] == 0
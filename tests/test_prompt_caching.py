@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("METRICS_LOG_PATH", "")
+os.environ.setdefault("WORKSHEET_POOL_SIZE", "0")
+
+import generators
+from model_routing import CLAUDE_MODEL, FAST_MODEL, Route
+
+QUESTION = "A die is rolled twice. Find the probability that the sum is 7."
+
+
+def test_fast_model_prompt_has_no_topic_reference():
+    system_prompt = generators.system_blocks("Instructions.", Route(FAST_MODEL), "Probability")
+    assert system_prompt == [{"type": "text", "text": "Instructions."}]
+
+
+def test_cacheable_topic_reference_gets_a_breakpoint():
+    system_prompt = generators.system_blocks("Instructions. " * 200, Route(CLAUDE_MODEL), "Probability")
+    assert len(system_prompt) == 2
+    assert system_prompt[-1]["cache_control"] == {"type": "ephemeral"}
+
+
+def test_uncached_prompt_keeps_its_closest_examples():
+    system_prompt, user_prompt = generators.similar_prompts(QUESTION, "Probability", "Medium")
+    assert len(system_prompt) == 1 and "cache_control" not in system_prompt[0]
+    assert user_prompt.count("\nExample ") == 2
@@ -0,0 +1,128 @@
+import os
+import sys
+import time
+import threading
+
+import pytest
+from anthropic.types import Usage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import request_scheduler
+from request_scheduler import BATCH, INTERACTIVE, PREFETCH, RequestScheduler, SchedulerTimeout, Ticket
+
+
+class Clock:
+    """Stands in for the scheduler's `time`; only moves when a test says so"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(request_scheduler, "time", clock)
+    return clock
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def blocked_scheduler(rpm=60, max_wait=30):
+    """A scheduler with no requests left this minute, so everything queues"""
+    scheduler = RequestScheduler(rpm=rpm, tpm=0, max_wait=max_wait)
+    scheduler.requests.level = 0
+    return scheduler
+
+
+def queue(scheduler, session, priority=INTERACTIVE):
+    """Start acquire() for a new ticket in a thread; returns once it is queued"""
+    ticket = Ticket(session, priority)
+    ticket.errors = []
+
+    def acquire():
+        try:
+            scheduler.acquire(1, ticket)
+        except SchedulerTimeout as error:
+            ticket.errors.append(error)
+
+    threading.Thread(target=acquire, daemon=True).start()
+    wait_until(lambda: ticket.queued)
+    return ticket
+
+
+def advance(scheduler, clock, seconds):
+    clock.now += seconds
+    with scheduler._cond:
+        scheduler._notify()
+
+
+def admission_order(scheduler, clock, tickets):
+    """Let the queued tickets through one at a time (60 rpm: one a second)"""
+    order = []
+    pending = list(tickets)
+    while pending:
+        advance(scheduler, clock, 1)
+        wait_until(lambda: any(t.waited is not None for t in pending))
+        admitted = [t for t in pending if t.waited is not None]
+        assert len(admitted) == 1
+        order.append(admitted[0])
+        pending.remove(admitted[0])
+    return order
+
+
+def test_sessions_take_turns_within_a_class(clock):
+    scheduler = blocked_scheduler()
+    tickets = [queue(scheduler, session) for session in ["a", "a", "a", "b", "b", "c"]]
+    order = admission_order(scheduler, clock, tickets)
+    assert [t.session for t in order] == ["a", "b", "c", "a", "b", "a"]
+
+
+def test_interactive_requests_go_before_prefetch_and_batch(clock):
+    scheduler = blocked_scheduler()
+    tickets = [queue(scheduler, "a", BATCH), queue(scheduler, "b", PREFETCH), queue(scheduler, "c", INTERACTIVE)]
+    order = admission_order(scheduler, clock, tickets)
+    assert [t.priority for t in order] == [INTERACTIVE, PREFETCH, BATCH]
+
+
+def test_promote_moves_a_queued_ticket_up(clock):
+    scheduler = blocked_scheduler()
+    tickets = [queue(scheduler, "a", PREFETCH), queue(scheduler, "b", PREFETCH), queue(scheduler, "c", BATCH)]
+    scheduler.promote(tickets[2], INTERACTIVE)
+    assert scheduler.stats()["queued"] == {INTERACTIVE: 1, PREFETCH: 2, BATCH: 0}
+    order = admission_order(scheduler, clock, tickets)
+    assert [t.session for t in order] == ["c", "a", "b"]
+
+
+def test_timed_out_ticket_leaves_the_queue(clock):
+    scheduler = blocked_scheduler(rpm=10, max_wait=5)  # one request every 6 s
+    first = queue(scheduler, "a")
+    clock.now = 4
+    second = queue(scheduler, "b")
+    advance(scheduler, clock, 1.5)
+    wait_until(lambda: first.errors)
+    assert not first.queued and second.queued
+    assert scheduler.stats()["timeouts"][INTERACTIVE] == 1
+    # The ticket behind it is next in line, not stuck
+    advance(scheduler, clock, 0.5)
+    wait_until(lambda: second.waited is not None)
+    assert not second.errors
+
+
+def test_release_returns_unused_tokens(clock):
+    scheduler = RequestScheduler(rpm=0, tpm=1000)
+    ticket = scheduler.acquire(500)
+    assert scheduler.tokens.level == 500
+    scheduler.release(ticket, Usage(input_tokens=100, output_tokens=50))
+    assert scheduler.tokens.level == 850
+    # Without usage (e.g. after an error) the whole estimate stays spent
+    scheduler.release(scheduler.acquire(500))
+    assert scheduler.tokens.level == 350
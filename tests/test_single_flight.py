@@ -0,0 +1,41 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from single_flight import SingleFlight
+
+
+def test_first_caller_leads_and_the_rest_are_coalesced():
+    flight = SingleFlight()
+    call, leader = flight.begin("key")
+    same, follower = flight.begin("key")
+    other, other_leader = flight.begin("other")
+    assert leader and not follower and other_leader
+    assert same is call and other is not call
+    assert flight.stats() == {"in_flight": 2, "leaders": 2, "coalesced": 1}
+
+
+def test_followers_get_the_leaders_result():
+    flight = SingleFlight()
+    call, _ = flight.begin("key")
+    threading.Timer(0.05, flight.finish, ("key", "text")).start()
+    assert call.wait(5) == "text"
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_a_failed_leader_publishes_none_and_frees_the_key():
+    flight = SingleFlight()
+    call, _ = flight.begin("key")
+    flight.finish("key", None)
+    assert call.wait(0) is None
+    _, leader = flight.begin("key")
+    assert leader
+
+
+def test_wait_gives_up_after_its_timeout():
+    flight = SingleFlight()
+    call, _ = flight.begin("key")
+    assert call.wait(0.01) is None
+    assert flight.stats()["in_flight"] == 1
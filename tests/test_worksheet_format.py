@@ -0,0 +1,65 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from worksheet_format import Part, Question, loads_question, parse_questions
+
+
+def test_one_question_per_line():
+    text = (
+        '{"question": "Solve $x^2 = 4$.", "parts": [], "marks": 5, "subtopic": "Quadratics"}\n'
+        '{"question": "Find $k$.", "parts": [{"label": "a", "text": "Show it.", "marks": 10}], "marks": null}\n'
+    )
+    assert parse_questions(text) == [
+        Question("Solve $x^2 = 4$.", [], 5, "Quadratics"),
+        Question("Find $k$.", [Part("a", "Show it.", 10)], None, None),
+    ]
+
+
+def test_pretty_printed_object_with_parts_on_their_own_lines():
+    text = "\n".join([
+        "```json",
+        '{"question": "A die is rolled.",',
+        ' "parts": [',
+        '  {"label": "a", "text": "Find $P(6)$.", "marks": 5}',
+        " ],",
+        ' "marks": 5}',
+        "```",
+    ])
+    assert parse_questions(text) == [Question("A die is rolled.", [Part("a", "Find $P(6)$.", 5)], 5)]
+
+
+def test_broken_object_does_not_swallow_later_questions():
+    text = "\n".join([
+        '{"question": "Cut off mid',
+        '{"question": "Second", "parts": []}',
+        '{"question": "Third", "parts": []}',
+    ])
+    assert [q.text for q in parse_questions(text)] == ["Second", "Third"]
+
+
+def test_unescaped_latex_commands_survive():
+    question = loads_question(r'{"question": "Find $\frac{1}{2}\theta$ where $x \neq 0$ and $\nabla f$."}')
+    assert question.text == r"Find $\frac{1}{2}\theta$ where $x \neq 0$ and $\nabla f$."
+
+
+def test_escaped_latex_is_unchanged():
+    question = loads_question(r'{"question": "Find $\\frac{1}{2}$ and $\\times$."}')
+    assert question.text == r"Find $\frac{1}{2}$ and $\times$."
+
+
+def test_json_escapes_followed_by_letters_stay_escapes():
+    question = loads_question(r'{"question": "First line\nThe second\tx and \"quoted\""}')
+    assert question.text == 'First line\nThe second\tx and "quoted"'
+
+
+def test_plain_text_fallback_when_no_json():
+    assert parse_questions("1. Solve $x + 1 = 2$.\n2. Expand $(x+1)^2$.") == [
+        Question("Solve $x + 1 = 2$."),
+        Question("Expand $(x+1)^2$."),
+    ]
+
+
+def test_empty_objects_are_skipped():
+    assert parse_questions('{"question": "", "parts": []}\n{"question": "Real"}') == [Question("Real")]
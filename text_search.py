@@ -0,0 +1,137 @@
+import re
+import math
+import heapq
+from bisect import bisect_left
+from collections import defaultdict, Counter
+
+# Okapi BM25 over past-paper question text, for picking the template
+# questions closest to what a student asked for. Pure Python and sparse: a
+# query only touches the postings of its own terms, not every question.
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+PREFIX_WEIGHT = 0.8  # share of the score a prefix-completed word gets
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from given has in into is it its of on or that
+the their then this to was were which with find show calculate hence
+""".split())
+
+
+def _stem(word):
+    # Just enough to line up "distributions"/"distribution", "rules"/"rule"
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [_stem(w) for w in _TOKEN.findall(str(text).lower()) if w not in STOPWORDS]
+
+
+def question_text(q):
+    """The searchable text of one past-paper question"""
+    return " ".join([q.get("description", "")] + list(q.get("concepts", [])) + list(q.get("topics", [])))
+
+
+class BM25Index:
+    """Inverted index of term -> {doc id: term frequency} with BM25 ranking"""
+
+    def __init__(self, documents, k1=BM25_K1, b=BM25_B):
+        postings = defaultdict(dict)
+        doc_len = []
+        for doc_id, text in enumerate(documents):
+            terms = Counter(tokenize(text))
+            doc_len.append(sum(terms.values()))
+            for term, tf in terms.items():
+                postings[term][doc_id] = tf
+        self._setup(dict(postings), doc_len, k1, b)
+
+    @classmethod
+    def from_postings(cls, postings, doc_len, avg_len=None, k1=BM25_K1, b=BM25_B):
+        """An index over postings built elsewhere (e.g. stored in the compact
+        index file). `postings` is any {term: {doc id: tf}} mapping; only the
+        query terms' values are ever read."""
+        index = cls.__new__(cls)
+        index._setup(postings, doc_len, k1, b, avg_len)
+        return index
+
+    def _setup(self, postings, doc_len, k1, b, avg_len=None):
+        self.k1 = k1
+        self.b = b
+        self.postings = postings
+        self.doc_len = doc_len
+        self.vocabulary = sorted(postings)
+        self.n = len(doc_len)
+        if avg_len is None:
+            avg_len = (sum(doc_len) / self.n) if self.n else 0.0
+        self.avg_len = avg_len
+        self._idf = {}
+
+    def idf(self, term):
+        idf = self._idf.get(term)
+        if idf is None:
+            df = len(self.postings[term])
+            idf = self._idf[term] = math.log(1 + (self.n - df + 0.5) / (df + 0.5))
+        return idf
+
+    def expand(self, prefix):
+        """Indexed terms starting with `prefix`"""
+        start = bisect_left(self.vocabulary, prefix)
+        terms = []
+        for term in self.vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _term_scores(self, term, candidates, scores, weight=1.0):
+        idf = self.idf(term)
+        postings = self.postings[term]
+        if candidates is None:
+            matches = postings.items()
+        elif len(candidates) < len(postings):
+            # A narrow filter (one topic at one difficulty): look its docs up
+            matches = ((doc_id, postings[doc_id]) for doc_id in candidates if doc_id in postings)
+        else:
+            matches = ((doc_id, tf) for doc_id, tf in postings.items() if doc_id in candidates)
+        for doc_id, tf in matches:
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / self.avg_len)
+            scores[doc_id] += weight * idf * tf * (self.k1 + 1) / (tf + norm)
+
+    def scores(self, query, candidates=None):
+        """{doc id: score} for docs sharing a term with `query`, optionally
+        restricted to the `candidates` id set"""
+        scores = defaultdict(float)
+        for term, weight in Counter(tokenize(query)).items():
+            if term in self.postings:
+                self._term_scores(term, candidates, scores, weight)
+        return scores
+
+    def search(self, query, k=5, candidates=None):
+        """Top-k (doc id, score), best first; ties keep document order"""
+        scores = self.scores(query, candidates)
+        return heapq.nsmallest(k, scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def prefix_search(self, query, candidates=None):
+        """Ids of docs containing every query word as a word or word prefix,
+        best first. Words completed from a prefix score a little less than
+        exact ones, so "tangent" ranks "tangent" above "tangential"."""
+        ranked = None
+        for token in dict.fromkeys(tokenize(query)):
+            scores = defaultdict(float)
+            for term in self.expand(token):
+                self._term_scores(term, candidates, scores, 1.0 if term == token else PREFIX_WEIGHT)
+            if ranked is None:
+                ranked = scores
+            else:
+                ranked = {i: s + scores[i] for i, s in ranked.items() if i in scores}
+            if not ranked:
+                return []
+        if ranked is None:
+            return []
+        return sorted(ranked, key=lambda i: (-ranked[i], i))
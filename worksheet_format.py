@@ -0,0 +1,192 @@
+import re
+import json
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional
+
+from question_bank import strip_numbering
+
+# Worksheet generators ask Claude for one JSON object per line (JSON Lines),
+# so every question, however many parts it has, arrives as exactly one record
+# and can be shown as soon as its line is complete.
+
+JSON_LINES_INSTRUCTIONS = (
+    "Output format: JSON Lines. Write each question as ONE JSON object on its own line, "
+    "and nothing else: no intro, no numbering, no code fences. Each object has the keys "
+    '"question" (the stem, or the whole question if it has no parts), '
+    '"parts" (a list of {"label": "a", "text": "...", "marks": 10}, or [] for a single-part question), '
+    '"marks" (total marks as an integer, or null) and '
+    '"subtopic" (which requested subtopic it practises). '
+    "Escape every LaTeX backslash for JSON, e.g. \"$\\\\frac{1}{2}$\"."
+)
+
+# Lines of a pretty-printed object buffered before giving up on it
+MAX_PENDING_LINES = 40
+
+
+@dataclass
+class Part:
+    label: str
+    text: str
+    marks: Optional[int] = None
+
+
+@dataclass
+class Question:
+    text: str
+    parts: List[Part] = field(default_factory=list)
+    marks: Optional[int] = None
+    subtopic: Optional[str] = None
+
+    def markdown(self):
+        """The whole question as one markdown block (what students see and Claude answers)"""
+        blocks = [self.text] if self.text else []
+        for part in self.parts:
+            marks = f" *[{part.marks} marks]*" if part.marks else ""
+            blocks.append(f"**({part.label})** {part.text}{marks}")
+        return "\n\n".join(blocks)
+
+    def to_dict(self):
+        return asdict(self)
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+    @classmethod
+    def from_dict(cls, data):
+        parts = []
+        for n, part in enumerate(data.get("parts") or []):
+            if isinstance(part, dict):
+                label = str(part.get("label") or chr(ord("a") + n)).strip("() ")
+                parts.append(Part(label, str(part.get("text", "")).strip(), _marks(part.get("marks"))))
+            elif str(part).strip():
+                parts.append(Part(chr(ord("a") + n), str(part).strip()))
+        text = data.get("question", data.get("text", ""))
+        return cls(
+            text=strip_numbering(str(text or "")),
+            parts=parts,
+            marks=_marks(data.get("marks")),
+            subtopic=data.get("subtopic") or None,
+        )
+
+    @classmethod
+    def from_stored(cls, stored):
+        """A question saved with to_json(), or plain text saved before records existed"""
+        try:
+            data = json.loads(stored)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            return cls.from_dict(data)
+        return cls(text=stored)
+
+
+def _marks(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# -----------------------------
+# PARSING
+# -----------------------------
+# A backslash run is either JSON-escaped already (\\), a LaTeX command (\frac,
+# \theta — which json would misread as \f, \t), or a JSON escape (\n, \", \u00e9)
+_BACKSLASH = re.compile(r'\\(\\|u[0-9a-fA-F]{4}|[A-Za-z]{2,}|.)', re.DOTALL)
+
+# LaTeX commands that start like a JSON escape; any other letters after \b, \f,
+# \n, \r or \t are a JSON escape followed by text ("\nThe", "\tx")
+_LATEX_LOOKALIKES = frozenset("""
+bar beta because begin big bigg binom bmod boxed bot bullet
+flat forall frac frown
+nabla natural ne neg neq newline nexists ngeq ni nleq nmid not notin nu
+rangle rceil rfloor rho right rightarrow rm
+tan tanh tau text textbf textit textrm tfrac therefore theta tilde times to top triangle
+""".split())
+
+
+def _escape_latex(match):
+    token = match.group(1)
+    if token == "\\" or re.fullmatch(r"u[0-9a-fA-F]{4}", token):
+        return match.group(0)
+    if token[0] in '"/bfnrt' and (len(token) == 1 or token not in _LATEX_LOOKALIKES):
+        return match.group(0)
+    return "\\\\" + token
+
+
+def _loads_object(text):
+    for candidate in (_BACKSLASH.sub(_escape_latex, text), text):
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+
+def loads_question(text):
+    """Parse one JSON question object, tolerating unescaped LaTeX backslashes"""
+    data = _loads_object(text)
+    return Question.from_dict(data) if data is not None else None
+
+
+class QuestionParser:
+    """Incremental JSON Lines parser: feed() it response lines as they arrive
+    and it returns the Questions each one completes.
+
+    A model that ignores the format still yields something: if no JSON turned
+    up at all, close() returns its non-empty lines as plain questions.
+    """
+
+    def __init__(self):
+        self.pending = []
+        self.plain = []
+        self.found = False
+
+    def feed(self, line):
+        line = line.strip()
+        if not line or line.startswith("```"):
+            return []
+        if self.pending and line.startswith("{"):
+            # A whole question on one line (not a part of a pretty-printed
+            # one): the object before it was broken, so drop that instead
+            data = _loads_object(line)
+            if data is not None and "question" in data:
+                self.found = True
+                self.pending = []
+                return self._complete(Question.from_dict(data))
+        if self.pending or line.startswith("{"):
+            self.pending.append(line)
+            question = loads_question(" ".join(self.pending))
+            if question is not None:
+                self.found = True
+                self.pending = []
+                return self._complete(question)
+            if len(self.pending) > MAX_PENDING_LINES:
+                self.pending = []
+            return []
+        self.plain.append(line)
+        return []
+
+    @staticmethod
+    def _complete(question):
+        return [question] if question.text or question.parts else []
+
+    def close(self):
+        if self.found:
+            return []
+        texts = (strip_numbering(line) for line in self.plain + self.pending)
+        return [Question(text=text) for text in texts if text]
+
+
+def iter_questions(lines):
+    """Turn a stream of response lines into Question records as each completes"""
+    parser = QuestionParser()
+    for line in lines:
+        yield from parser.feed(line)
+    yield from parser.close()
+
+
+def parse_questions(text):
+    return list(iter_questions(text.split("\n")))
@@ -0,0 +1,147 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+
+from request_scheduler import BATCH, set_request_context
+
+# Ready-made worksheets per (topic, subtopics, difficulty), topped up by a
+# background thread so a button press can be served without waiting on Claude.
+# Each worksheet is handed out once, so students still get fresh questions.
+# Opt-in (WORKSHEET_POOL_SIZE > 0), since every pooled worksheet is paid for,
+# and only keys asked for more than once are kept topped up.
+
+POOL_SIZE = int(os.environ.get("WORKSHEET_POOL_SIZE", 0))  # ready worksheets per key; 0 disables
+POOL_MAX_KEYS = int(os.environ.get("WORKSHEET_POOL_MAX_KEYS", 30))
+POOL_REFILL_PER_MINUTE = float(os.environ.get("WORKSHEET_POOL_REFILL_PER_MINUTE", 6))
+POOL_MIN_REQUESTS = int(os.environ.get("WORKSHEET_POOL_MIN_REQUESTS", 2))  # before a key is refilled
+# A key whose generation fails or comes back empty waits this long, doubling
+# with each failure in a row up to POOL_MAX_BACKOFF, before it is tried again
+POOL_BACKOFF = 10.0
+POOL_MAX_BACKOFF = 600.0
+
+
+class WorksheetPool:
+    """Bounded pool of pre-generated worksheets with background refill"""
+
+    def __init__(self, generate, size=POOL_SIZE, max_keys=POOL_MAX_KEYS, refill_per_minute=POOL_REFILL_PER_MINUTE,
+                 min_requests=POOL_MIN_REQUESTS):
+        self.generate = generate
+        self.size = size
+        self.max_keys = max_keys
+        self.refill_interval = 60.0 / refill_per_minute if refill_per_minute > 0 else 0.0
+        self.min_requests = min_requests
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.errors = 0
+        self.empty = 0
+        self.evicted = 0
+        # key -> deque of ready worksheets, least recently requested first
+        self._ready = OrderedDict()
+        self._requests = {}  # key -> times requested
+        self._failures = {}  # key -> (failures in a row, monotonic time it may be retried)
+        self._cond = threading.Condition()
+        self._worker = None
+
+    @staticmethod
+    def key(topic, subtopics, difficulty):
+        return (topic, tuple(sorted(subtopics)), difficulty)
+
+    def take(self, topic, subtopics, difficulty):
+        """Pop a ready worksheet, or return None (and queue this key for refill)"""
+        if self.size <= 0:
+            return None
+
+        key = self.key(topic, subtopics, difficulty)
+        with self._cond:
+            ready = self._ready.get(key)
+            if ready is None:
+                ready = self._ready[key] = deque()
+                while len(self._ready) > self.max_keys:
+                    dropped_key, dropped = self._ready.popitem(last=False)
+                    self._requests.pop(dropped_key, None)
+                    self._failures.pop(dropped_key, None)
+                    self.evicted += len(dropped)
+            self._ready.move_to_end(key)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+            worksheet = ready.popleft() if ready else None
+            if worksheet is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+            self._ensure_worker()
+            self._cond.notify()
+            return worksheet
+
+    def _next_key(self):
+        """(key to refill or None, seconds until a backed-off key may be retried or None)"""
+        # Most recently requested keys are refilled first
+        now = time.monotonic()
+        retry_in = None
+        for key in reversed(self._ready):
+            if len(self._ready[key]) >= self.size or self._requests.get(key, 0) < self.min_requests:
+                continue
+            _, retry_at = self._failures.get(key, (0, 0.0))
+            if retry_at <= now:
+                return key, None
+            retry_in = min(retry_in, retry_at - now) if retry_in is not None else retry_at - now
+        return None, retry_in
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._refill_loop, name="worksheet-pool", daemon=True)
+            self._worker.start()
+
+    def _refill_loop(self):
+        # Refills yield to students' requests in the request scheduler
+        set_request_context("worksheet-pool", BATCH)
+        while True:
+            with self._cond:
+                key, retry_in = self._next_key()
+                while key is None:
+                    self._cond.wait(retry_in)
+                    key, retry_in = self._next_key()
+
+            try:
+                worksheet = self.generate(*key)
+            except Exception:
+                self.errors += 1
+                worksheet = None
+            else:
+                if not worksheet:
+                    self.empty += 1
+
+            with self._cond:
+                ready = self._ready.get(key)
+                if not worksheet:
+                    if ready is not None:
+                        failures = self._failures.get(key, (0, 0.0))[0] + 1
+                        backoff = min(POOL_MAX_BACKOFF, POOL_BACKOFF * 2 ** (failures - 1))
+                        self._failures[key] = (failures, time.monotonic() + backoff)
+                # The key may have been evicted while we were generating
+                elif ready is not None and len(ready) < self.size:
+                    self._failures.pop(key, None)
+                    ready.append(worksheet)
+                    self.generated += 1
+
+            time.sleep(self.refill_interval)
+
+    def stats(self):
+        with self._cond:
+            ready = sum(len(r) for r in self._ready.values())
+            keys = len(self._ready)
+        requests = self.hits + self.misses
+        return {
+            "keys": keys,
+            "ready": ready,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "generated": self.generated,
+            "errors": self.errors,
+            "empty": self.empty,
+            "evicted": self.evicted,
+        }